@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+
+"""
+Makes the serialization layer shared by all the stages, in ../common, importable
+
+The stages run as scripts from their own directory, so the repository root is not on the module
+path. Every module of the stage that imports common imports this one first.
+"""
+
+import os
+import sys
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
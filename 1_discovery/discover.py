@@ -1,10 +1,11 @@
 #!/usr/bin/env python3
 
 import argparse
-import boto3
 import json
+import os
 
-from scalr_session import ScalrSession
+import common_path  # noqa: F401 (makes ../common importable)
+from common import serialization
 from util import json_serial
 
 
@@ -16,11 +17,16 @@ def load_scalr_password():
 
 
 def main(args):
+    # boto3 and requests (through scalr_session) take a while to import, don't load them for --help
+    import boto3
+    from scalr_session import ScalrSession
+
     # Step 1 : get list of servers available for import from Scalr
     scalr_user = 'admin'
     scalr_password = args.password or load_scalr_password()
     scalr_url = args.url
-    scalr_client = ScalrSession(scalr_url)
+    cache_file = None if args.no_session_cache else os.path.expanduser(args.session_cache)
+    scalr_client = ScalrSession(scalr_url, {'timeout': (args.connect_timeout, args.read_timeout)}, cache_file)
     scalr_client.login('admin', scalr_password)
     scalr_client.admin_login_as(args.account)
     servers = {s['cloudServerId']: s for s in scalr_client.get_servers_for_import(args.location)}
@@ -31,7 +37,11 @@ def main(args):
         for i in r['Instances']:
             instance_id = i['InstanceId']
             servers[instance_id]['ec2-data'] = i
-    print(json.dumps(servers, indent=2, default=json_serial))
+    if args.json_lines:
+        for server in servers.values():
+            print(serialization.json_dumps(server, default=json_serial))
+    else:
+        print(serialization.json_dumps(servers, indent=True, default=json_serial))
 
 
 if __name__ == '__main__':
@@ -41,5 +51,12 @@ if __name__ == '__main__':
     parser.add_argument('--location', '-l', required=True, help='Cloud Location (region for EC2, e.g. us-east-1)')
     parser.add_argument('--url', '-u', help='Scalr URL', default='http://localhost')
     parser.add_argument('--password', '-p', help='Scalr admin password. Taken from /etc/scalr-server-secrets.json if not provided.')
+    parser.add_argument('--connect-timeout', type=float, default=10, help='Seconds to wait for a connection to Scalr')
+    parser.add_argument('--read-timeout', type=float, default=60, help='Seconds to wait for data from Scalr')
+    parser.add_argument('--session-cache', default='~/.scalr-session.json',
+                        help='File the Scalr login is cached in (readable by the current user only), to reuse it on the next runs')
+    parser.add_argument('--no-session-cache', action='store_true', help='Log in again, and do not cache the login')
+    parser.add_argument('--json-lines', action='store_true',
+                        help='Print one server per line, which the planning step can process as a stream')
     main(parser.parse_args())
 
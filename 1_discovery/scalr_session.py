@@ -1,32 +1,76 @@
 # -*- coding: utf-8 -*-
 
-import json
+import logging
+import os
+import stat
+import time
+
 import requests
 
+import common_path  # noqa: F401 (makes ../common importable)
+from common.serialization import json_dumps, json_loads, response_json
 from exceptions import ScalrRequestFailure
 
 
 PAGINATION = 50
 
+# (connect, read) timeouts of the requests, in seconds, unless request_options sets one
+DEFAULT_TIMEOUT = (10, 60)
+
+# Seconds a cached login is reused for, at most (less if the session cookies expire sooner)
+SESSION_MAX_AGE = 3600
+
 
 def check_response(response):
     response.raise_for_status()
-    if not response.json()["success"]:
+    body = response_json(response)
+    if not body["success"]:
         try:
-            err_msg = response.json()["errorMessage"]
+            err_msg = body["errorMessage"]
         except KeyError:
             try:
-                err_msg = ", ".join([ "{0}: {1}.".format(field, ", ".join(errors)) for field, errors in response.json()["errors"].items()])
+                err_msg = ", ".join([ "{0}: {1}.".format(field, ", ".join(errors)) for field, errors in body["errors"].items()])
             except (TypeError, KeyError):
                 err_msg = response.content
         raise ScalrRequestFailure(err_msg)
 
 
+def load_session_cache(fname):
+    """ Returns the logins cached in fname, {} if there is none or if other users can read it """
+    try:
+        if os.stat(fname).st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+            logging.warning('Ignoring session cache %s, it is readable by other users', fname)
+            return {}
+        with open(fname, 'rb') as cache_file:
+            return json_loads(cache_file.read())
+    except (OSError, ValueError):
+        return {}
+
+
+def save_session_cache(fname, cache):
+    """ Writes the cache atomically, readable and writable by the current user only """
+    tmp_fname = fname + '.tmp'
+    fd = os.open(tmp_fname, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    # The mode of os.open only applies if it creates the file
+    os.fchmod(fd, 0o600)
+    with os.fdopen(fd, 'w') as cache_file:
+        cache_file.write(json_dumps(cache))
+    os.replace(tmp_fname, fname)
+
+
 class ScalrSession(requests.Session):
-    def __init__(self, base_url, request_options=None):
+    """ Session of the Scalr web UI
+
+    With a cache_file, the logins (cookies, CSRF token and context) are saved to it and reused by
+    the next sessions until they expire, which saves the login round trips. A cached login that
+    the server no longer accepts is replaced by a new one, on the first request that fails.
+    """
+
+    def __init__(self, base_url, request_options=None, cache_file=None):
         super(ScalrSession, self).__init__()
         self.base_url = base_url
-        self.request_options = request_options if request_options is not None else {}
+        self.request_options = {"timeout": DEFAULT_TIMEOUT}
+        self.request_options.update(request_options or {})
 
         self.headers["X-Scalr-Token"] = "key"
         self.headers["X-Scalr-Interface"] = "v2"
@@ -34,6 +78,12 @@ class ScalrSession(requests.Session):
 
         self.csrf_token = None
 
+        self.cache_file = cache_file
+        self.login_args = None      # (username, password, account id, tfa), to log in again
+        self.restored = False       # Whether the login comes from the cache, and was not used yet
+        self.account_id = None      # Account the admin is logged in as
+        self.contexts = {}          # Account id -> (env id, user id) of the admin logged in as it
+
 
     @classmethod
     def from_account(cls, account):
@@ -82,7 +132,17 @@ class ScalrSession(requests.Session):
         request_kwargs.update(kwargs)
         request_kwargs.update(self.request_options)
         res = super(ScalrSession, self).request(*args, **request_kwargs)
-        check_response(res)
+        try:
+            check_response(res)
+        except (requests.HTTPError, ScalrRequestFailure):
+            if not self.restored:
+                raise
+            logging.info('Cached Scalr session rejected, logging in again')
+            self.restored = False
+            self._login_again()
+            res = super(ScalrSession, self).request(*args, **request_kwargs)
+            check_response(res)
+        self.restored = False
         return res
 
 
@@ -102,7 +162,7 @@ class ScalrSession(requests.Session):
             params.update(extra_params)
 
             res = self.get(list_url, params=params)
-            json = res.json()
+            json = response_json(res)
 
             results.extend(json["data"])
             if len(results) == int(json["total"]):
@@ -115,6 +175,16 @@ class ScalrSession(requests.Session):
     ###################
 
     def login(self, username, password, account_id=None, tfa=None):
+        """ Logs in, or restores the login from the cache file (and then returns None) """
+        self.login_args = (username, password, account_id, tfa)
+        if self._restore_login():
+            return None
+        res = self._login(username, password, account_id, tfa)
+        self._save_login()
+        return res
+
+
+    def _login(self, username, password, account_id=None, tfa=None):
         data = {"scalrLogin": username, "scalrPass": password, "scalrKeepSession": "on"}
         if account_id is not None:
             data.update({"accountId": account_id})
@@ -122,14 +192,71 @@ class ScalrSession(requests.Session):
             data.update({"tfaGglCode": tfa})
 
         res = self.post("/guest/xLogin", data)
-        self.csrf_token = res.json().get("specialToken")
+        self.csrf_token = response_json(res).get("specialToken")
         self._load_context()
 
         return res
 
 
+    def _login_again(self):
+        """ Replaces a login restored from the cache that the server no longer accepts """
+        account_id = self.account_id
+        self.cookies.clear()
+        self.csrf_token = None
+        self.account_id = None
+        self.contexts = {}
+        self._login(*self.login_args)
+        if account_id is not None:
+            self.admin_login_as(account_id)
+        self._save_login()
+
+
+    def _cache_key(self):
+        username, _, account_id, _ = self.login_args
+        return '{0} {1} {2}'.format(self.base_url, username, account_id or '')
+
+
+    def _restore_login(self):
+        if self.cache_file is None:
+            return False
+        login = load_session_cache(self.cache_file).get(self._cache_key())
+        if login is None or login['expires'] <= time.time():
+            return False
+        for cookie in login['cookies']:
+            self.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'], path=cookie['path'],
+                             expires=cookie['expires'], secure=cookie['secure'])
+        self.csrf_token = login['csrf_token']
+        self.env_id = login['env_id']
+        self.user_id = login['user_id']
+        self.account_id = login['account_id']
+        self.contexts = {account_id: tuple(context) for account_id, context in login['contexts'].items()}
+        self.restored = True
+        return True
+
+
+    def _save_login(self):
+        if self.cache_file is None or self.login_args is None:
+            return
+        cookies = [{'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain, 'path': cookie.path,
+                    'expires': cookie.expires, 'secure': cookie.secure} for cookie in self.cookies]
+        expires = min([cookie['expires'] for cookie in cookies if cookie['expires']] + [time.time() + SESSION_MAX_AGE])
+        # Reload the cache just before writing it, to keep the logins other runs saved meanwhile
+        cache = load_session_cache(self.cache_file)
+        cache = {key: login for key, login in cache.items() if login['expires'] > time.time()}
+        cache[self._cache_key()] = {
+            'expires': expires,
+            'cookies': cookies,
+            'csrf_token': self.csrf_token,
+            'env_id': self.headers.get('X-Scalr-EnvId'),
+            'user_id': self.headers.get('X-Scalr-UserId'),
+            'account_id': self.account_id,
+            'contexts': self.contexts,
+        }
+        save_session_cache(self.cache_file, cache)
+
+
     def _get_context(self):
-        return self.post("/guest/xGetContext").json()
+        return response_json(self.post("/guest/xGetContext"))
 
 
     def _load_context(self):
@@ -151,6 +278,9 @@ class ScalrSession(requests.Session):
         })
         self.env_id = env_id
         self._load_context()
+        if self.account_id is not None:
+            self.contexts[self.account_id] = (self.env_id, self.user_id)
+        self._save_login()
 
 
     ###################
@@ -169,12 +299,25 @@ class ScalrSession(requests.Session):
 
 
     def admin_login_as(self, account_id):
+        """ Switches to the account, unless the session is already logged in as it. The context of
+        the accounts is only loaded the first time the admin logs in as them """
+        account_id = str(account_id)
+        if account_id == self.account_id:
+            return
+        # Not logged in as any account while switching, in case the switch requires a new login
+        self.account_id = None
         self.post("/admin/accounts/xLoginAs", data={
             "accountId": account_id
         })
-        self.env_id = None
-        self.user_id = None
-        self._load_context()
+        self.account_id = account_id
+        if account_id in self.contexts:
+            self.env_id, self.user_id = self.contexts[account_id]
+        else:
+            self.env_id = None
+            self.user_id = None
+            self._load_context()
+            self.contexts[account_id] = (self.env_id, self.user_id)
+        self._save_login()
 
 
     #####################
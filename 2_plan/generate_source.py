@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Generates synthetic source CSV files, to test and benchmark the plan creation at scale
+
+Servers are spread randomly over the farm roles, every farm role getting at least one server
+when there are enough of them. Optionally, errors of the kinds validate.py detects are seeded
+on random lines, each one where validate.py reports it.
+"""
+
+import argparse
+import csv
+import random
+import uuid
+
+
+EC2_REGIONS = ['us-east-1', 'us-west-1', 'us-west-2', 'eu-west-1', 'eu-central-1', 'ap-southeast-2']
+EC2_INSTANCE_TYPES = ['t2.micro', 't2.medium', 'm3.medium', 'm4.large', 'c4.xlarge', 'r4.2xlarge']
+
+ERROR_KINDS = ['alias', 'project', 'farm-role', 'duplicate', 'columns', 'security-groups']
+
+# Inconsistencies are errors between the lines of the same farm (project) or farm role (farm-role)
+GROUP_KEYS = {
+    'project': lambda row: row[1],
+    'farm-role': lambda row: (row[1], row[2]),
+}
+
+# Random lines tried for an error before giving up (when few lines are left for it)
+SEED_TRIES = 100
+
+
+def aws_id(rnd, prefix):
+    return '{}-{:08x}'.format(prefix, rnd.getrandbits(32))
+
+
+def ec2_farm_role(rnd):
+    """ Returns a function making the CSV columns after the farm role alias for a server of a new farm role """
+    region = rnd.choice(EC2_REGIONS)
+    instance_type = rnd.choice(EC2_INSTANCE_TYPES)
+    vpc = aws_id(rnd, 'vpc')
+    subnets = [aws_id(rnd, 'subnet') for _ in range(rnd.randint(1, 3))]
+    role_id = str(rnd.randint(10000, 99999))
+    security_groups = ' '.join(aws_id(rnd, 'sg') for _ in range(rnd.randint(1, 3)))
+
+    def columns(rnd, project):
+        return [region, instance_type, vpc, rnd.choice(subnets), role_id, security_groups, project]
+    return columns
+
+
+def vmware_farm_role(rnd):
+    """ Returns a function making the CSV columns after the farm role alias for a server of a new farm role """
+    values = [
+        'datacenter-{}'.format(rnd.randint(1, 99)),
+        '{:012x}'.format(rnd.getrandbits(48)),
+        'network-{}'.format(rnd.randint(1, 999)),
+        str(rnd.randint(10000, 99999)),
+        'domain-s{}'.format(rnd.randint(1, 99)),
+        'host-{}'.format(rnd.randint(1, 999)),
+    ]
+    extra_values = [
+        'group-v{}'.format(rnd.randint(1, 999)),
+        'resgroup-{}'.format(rnd.randint(1, 999)),
+        'datastore-{}'.format(rnd.randint(1, 999)),
+    ]
+
+    def columns(rnd, project):
+        return values + [project] + extra_values
+    return columns
+
+
+def seed_error(platform, rows, rnd, free, groups):
+    """ Introduces an error on a random line, returns the kind of error, or None if no line was
+    found for it
+
+    The errors do not share lines, so that they do not hide each other (a line with missing
+    columns is not checked further): the lines used are removed from free, the set of the indexes
+    of the lines without errors. A duplicate also uses the line whose server id it copies, and an
+    inconsistency another line of the same group, left as it was; groups maps the kinds of
+    GROUP_KEYS to the lists of line indexes of each group.
+    """
+    kinds = ERROR_KINDS if platform == 'ec2' else ERROR_KINDS[:-1]
+    kind = rnd.choice(kinds)
+    for _ in range(SEED_TRIES):
+        index = rnd.randrange(len(rows))
+        if index not in free:
+            continue
+        if kind == 'duplicate':
+            other = rnd.randrange(len(rows))
+        elif kind in GROUP_KEYS:
+            group = groups[kind][GROUP_KEYS[kind](rows[index])]
+            other = next((i for i in group if i != index and i in free), index)
+        else:
+            other = None
+        if other == index or other is not None and other not in free:
+            continue
+        free.difference_update((index, other))
+        break
+    else:
+        return None
+    row = rows[index]
+    if kind == 'alias':
+        row[2] = row[2] + '_invalid'
+    elif kind == 'project':
+        row[9] = row[9] + '-other'
+    elif kind == 'farm-role':
+        row[4] = row[4] + 'x'
+    elif kind == 'duplicate':
+        row[0] = rows[other][0]
+    elif kind == 'columns':
+        del row[-1]
+    elif kind == 'security-groups':
+        row[8] = ''
+    return kind
+
+
+def generate_rows(platform, farms, roles_per_farm, servers, projects, errors=0, project_names=False, seed=None):
+    """ Returns the lines of a source CSV file for the platform ('ec2' or 'vmware'), and the
+    kinds of errors seeded in them """
+    rnd = random.Random(seed)
+    if project_names:
+        project_list = ['Project {}'.format(i + 1) for i in range(projects)]
+    else:
+        project_list = [str(uuid.UUID(int=rnd.getrandbits(128))) for _ in range(projects)]
+    make_farm_role = ec2_farm_role if platform == 'ec2' else vmware_farm_role
+
+    farm_roles = []     # (farm name, alias, project, columns)
+    for f in range(farms):
+        farm_name = 'Farm {}'.format(f + 1)
+        project = project_list[f % len(project_list)]
+        for r in range(roles_per_farm):
+            farm_roles.append((farm_name, 'farm-{}-role-{}'.format(f + 1, r + 1), project, make_farm_role(rnd)))
+
+    first_server = 16 ** 16 + rnd.getrandbits(60) if platform == 'ec2' else 1
+    server_numbers = range(first_server, first_server + servers)
+    rows = []
+    for i, server_number in enumerate(server_numbers):
+        if i < len(farm_roles):
+            farm_name, alias, project, columns = farm_roles[i]
+        else:
+            farm_name, alias, project, columns = rnd.choice(farm_roles)
+        server_id = 'i-{:017x}'.format(server_number) if platform == 'ec2' else 'vm-{}'.format(server_number)
+        rows.append([server_id, farm_name, alias] + columns(rnd, project))
+    rnd.shuffle(rows)
+
+    seeded = []
+    if rows and errors:
+        free = set(range(len(rows)))
+        groups = dict((kind, {}) for kind in GROUP_KEYS)
+        for index, row in enumerate(rows):
+            for kind, key in GROUP_KEYS.items():
+                groups[kind].setdefault(key(row), []).append(index)
+        for _ in range(errors):
+            kind = seed_error(platform, rows, rnd, free, groups)
+            if kind is not None:
+                seeded.append(kind)
+    return rows, seeded
+
+
+def main(args):
+    rows, seeded = generate_rows(args.platform, args.farms, args.roles_per_farm, args.servers, args.projects,
+                                 args.errors, args.project_names, args.seed)
+    with open(args.output, 'x', newline='') as outfile:
+        csv.writer(outfile).writerows(rows)
+    print('Wrote {} lines to {}.'.format(len(rows), args.output))
+    if seeded:
+        print('Seeded errors: {}'.format(', '.join('{} {}'.format(seeded.count(kind), kind) for kind in sorted(set(seeded)))))
+    if len(seeded) < args.errors:
+        print('{} errors could not be seeded, there are not enough lines for them.'.format(args.errors - len(seeded)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--platform', '-P', choices=['ec2', 'vmware'], default='ec2', help='Cloud platform of the servers')
+    parser.add_argument('--farms', '-f', type=int, default=10, help='Number of farms')
+    parser.add_argument('--roles-per-farm', '-r', type=int, default=3, help='Number of farm roles in each farm')
+    parser.add_argument('--servers', '-n', type=int, default=1000, help='Number of servers (lines)')
+    parser.add_argument('--projects', '-j', type=int, default=3, help='Number of projects the farms are spread over')
+    parser.add_argument('--project-names', '-p', action='store_true', help='Use project names instead of project IDs')
+    parser.add_argument('--errors', '-E', type=int, default=0, help='Number of errors to seed in the file')
+    parser.add_argument('--seed', type=int, help='Random seed, to generate the same file again')
+    parser.add_argument('--output', '-o', help='CSV file to write (MUST NOT exist)', required=True)
+    main(parser.parse_args())
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Builds the EC2 source CSV lines from the output of discover.py
+
+The output of discover.py is streamed and joined with a small mapping file that assigns
+servers to farms and farm roles. All the other columns (region, instance type, VPC, subnet,
+security groups) are taken from the EC2 data of each server.
+
+Mapping file format (CSV):
+instance id or tag:<key>=<value>, farm name, farm role alias, role id, project id or name
+
+Lines matching an instance id have precedence over lines matching a tag. When several tag
+lines match a server, the first one in the file is used.
+"""
+
+import argparse
+import csv
+import sys
+
+import common_path  # noqa: F401 (makes ../common importable)
+from common import serialization
+
+
+def read_discovery(fname):
+    """ Yields the discovered servers, from JSON lines (discover.py --json-lines) or from the
+    JSON object discover.py prints by default """
+    with open(fname) as discovery_file:
+        first_line = discovery_file.readline()
+        try:
+            server = serialization.json_loads(first_line)
+        except ValueError:
+            server = None
+        if isinstance(server, dict) and 'cloudServerId' in server:
+            yield server
+            for line in discovery_file:
+                if line.strip():
+                    yield serialization.json_loads(line)
+        else:
+            discovery_file.seek(0)
+            for server in serialization.json_loads(discovery_file.read()).values():
+                yield server
+
+
+def load_mapping(fname):
+    """ Returns the dicts of instance id -> mapping and (tag key, tag value) -> mapping, where
+    mapping is (farm name, farm role alias, role id, project) """
+    by_instance = {}
+    by_tag = {}
+    with open(fname, newline='') as mapping_file:
+        for line_number, line in enumerate(csv.reader(mapping_file), 1):
+            if not line:
+                continue
+            if len(line) != 5:
+                raise ValueError('Mapping file line {}: expected 5 columns, found {}'.format(line_number, len(line)))
+            match, mapping = line[0].strip(), tuple(line[1:])
+            if match.startswith('tag:'):
+                key, sep, value = match[4:].partition('=')
+                if not sep:
+                    raise ValueError('Mapping file line {}: expected tag:<key>=<value>, found {}'.format(line_number, match))
+                by_tag.setdefault((key, value), mapping)
+            else:
+                by_instance[match] = mapping
+    return by_instance, by_tag
+
+
+def join(servers, by_instance, by_tag, unmatched):
+    """ Yields the source CSV lines for the servers that match the mapping, and appends the ids
+    of the others to unmatched """
+    tag_priority = {key: i for i, key in enumerate(by_tag)}
+    for server in servers:
+        ec2 = server.get('ec2-data')
+        if ec2 is None:
+            unmatched.append(server.get('cloudServerId'))
+            continue
+        instance_id = ec2['InstanceId']
+        mapping = by_instance.get(instance_id)
+        if mapping is None:
+            tags = [(tag['Key'], tag['Value']) for tag in ec2.get('Tags', [])]
+            matches = [tag for tag in tags if tag in by_tag]
+            if matches:
+                mapping = by_tag[min(matches, key=tag_priority.get)]
+        if mapping is None:
+            unmatched.append(instance_id)
+            continue
+        farm_name, alias, role_id, project = mapping
+        yield [
+            instance_id,
+            farm_name,
+            alias,
+            ec2['Placement']['AvailabilityZone'][:-1],
+            ec2['InstanceType'],
+            ec2.get('VpcId', ''),
+            ec2.get('SubnetId', ''),
+            role_id,
+            ' '.join(group['GroupId'] for group in ec2.get('SecurityGroups', [])),
+            project,
+        ]
+
+
+def discovery_rows(discovery_fname, mapping_fname, unmatched):
+    by_instance, by_tag = load_mapping(mapping_fname)
+    return join(read_discovery(discovery_fname), by_instance, by_tag, unmatched)
+
+
+def main(args):
+    unmatched = []
+    writer = csv.writer(sys.stdout)
+    for row in discovery_rows(args.discovery, args.mapping, unmatched):
+        writer.writerow(row)
+    if unmatched:
+        print('{} servers not matched by the mapping: {}'.format(len(unmatched), ' '.join(map(str, unmatched))),
+              file=sys.stderr)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--discovery', '-d', help='Output of discover.py', required=True)
+    parser.add_argument('--mapping', '-m', help='Mapping of instance ids or tags to farms and farm roles', required=True)
+    main(parser.parse_args())
@@ -3,10 +3,13 @@
 
 import argparse
 import csv
-import yaml
 
+import common_path  # noqa: F401 (makes ../common importable)
+from common import serialization
 from platforms import ec2
+from join_discovery import discovery_rows
 from platforms import vmware
+from validate import validate
 
 
 def make_step_id():
@@ -244,17 +247,38 @@ def make_simple_plan(platform, data, envId):
 def write_plan(plan, fname):
     # Refuse to overwrite existing file
     with open(fname, 'x') as outfile:
-        yaml.dump(plan, outfile, default_flow_style=False)
+        serialization.yaml_dump(plan, outfile)
 
 
 def main(args):
-    with open(args.source, newline='') as source_file:
-        reader = csv.reader(source_file)
-        data = [l for l in reader]
+    if args.discovery:
+        if args.platform != 'ec2' or not args.mapping:
+            print('ERROR: --discovery is only supported for EC2 and requires --mapping')
+            raise ValueError
+        unmatched = []
+        data = list(discovery_rows(args.discovery, args.mapping, unmatched))
+        if unmatched:
+            print('WARNING: {} discovered servers not matched by the mapping, skipped: {}'.format(
+                len(unmatched), ' '.join(map(str, unmatched))))
+        source_name = args.discovery
+    else:
+        with open(args.source, newline='') as source_file:
+            reader = csv.reader(source_file)
+            data = [l for l in reader]
+        source_name = args.source
     if args.platform == 'ec2':
         platform = ec2
     elif args.platform == 'vmware':
         platform = vmware
+    errors = validate(platform, data)
+    for line_number, message in errors:
+        print('ERROR at line {}: {}'.format(line_number, message))
+    if errors:
+        print('Found {} errors in {}. Aborting.'.format(len(errors), source_name))
+        raise ValueError
+    if args.check:
+        print('No errors found in {} ({} lines).'.format(source_name, len(data)))
+        return
     setup_plan = make_farms_and_roles_plan(platform, data, args.environment, args.project_names)
     print('Created setup plan with {} steps.'.format(len(setup_plan)))
     write_plan(setup_plan, args.output + '.setup.yml')
@@ -265,9 +289,13 @@ def main(args):
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument('--source', '-s', help='Source CSV file', required=True)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--source', '-s', help='Source CSV file')
+    source.add_argument('--discovery', '-d', help='Output of discover.py to build the source lines from (EC2 only)')
+    parser.add_argument('--mapping', '-m', help='With --discovery, mapping of instance ids or tags to farms and farm roles')
     parser.add_argument('--environment', '-e', help='Environment this import plan is for', required=True)
     parser.add_argument('--output', '-o', help='File to write the plan to (MUST NOT exist)', required=True)
     parser.add_argument('--project-names', '-p', help='Treat Project column in source CSV as project names and not IDs', action='store_true')
     parser.add_argument('--platform', '-P', choices=['ec2', 'vmware'], help='Cloud platform to import servers from', required=True)
+    parser.add_argument('--check', '-c', help='Only validate the source CSV file, do not create any plan', action='store_true')
     main(parser.parse_args())
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Optimizer for import plans
+
+- Lookups (find-* steps) for farms, farm roles and projects that a setup plan already
+  created or found are replaced by the ids recorded in the .status file of that setup plan
+- Identical lookups are only kept once, references to the duplicates point to the first one
+- Several plans can be merged into one, sharing their lookups
+"""
+
+import argparse
+
+import common_path  # noqa: F401 (makes ../common importable)
+from common import serialization
+from make_plan import write_plan
+
+
+FIND_ACTIONS = ('find-farm', 'find-farm-role', 'find-project')
+
+
+def canonical(d):
+    return tuple(sorted((k, str(v)) for k, v in d.items()))
+
+
+def lookup_key(action, params, query):
+    """ Identifies the object a find-* step looks up """
+    return (action, canonical(params), canonical(query))
+
+
+def load_plan(fname):
+    with open(fname) as plan_file:
+        return serialization.yaml_load(plan_file)
+
+
+def load_status(plan_fname):
+    try:
+        with open(plan_fname + '.status') as status_file:
+            return serialization.yaml_load(status_file) or {}
+    except FileNotFoundError:
+        return {}
+
+
+def resolve_value(value, outputs):
+    """ Resolves a $ref/ string against the outputs of a run, None if it is not available """
+    if isinstance(value, str) and value.startswith('$ref/'):
+        step_id, name = value[5:].split('/')[:2]
+        return outputs.get(step_id, {}).get(name)
+    return value
+
+
+def known_ids(setup_plan, outputs):
+    """ Returns a dict of lookup key -> id of the objects created or found by a setup plan run """
+    known = {}
+    for step in setup_plan:
+        params = step.get('params', {})
+        step_outputs = outputs.get(step['id'], {})
+        if not step_outputs.get('complete'):
+            continue
+        if step['action'] == 'create-farm':
+            key = lookup_key('find-farm', params, {'name': step['body']['name']})
+            known[key] = step_outputs['farmid']
+        elif step['action'] == 'create-farm-role':
+            farm_id = resolve_value(params['farmId'], outputs)
+            if farm_id is None:
+                continue
+            key = lookup_key('find-farm-role', dict(params, farmId=farm_id), {'alias': step['body']['alias']})
+            known[key] = step_outputs['farmroleid']
+        elif step['action'] in FIND_ACTIONS:
+            key = lookup_key(step['action'], params, step.get('query', {}))
+            known[key] = step_outputs[step['outputs'][0]['name']]
+    return known
+
+
+def rewrite_references(d, replacements):
+    """ Returns a copy of d where references to replaced steps point to the step kept in their
+    place, or are substituted with the value recorded for them """
+    if isinstance(d, dict):
+        return {k: rewrite_references(v, replacements) for k, v in d.items()}
+    elif isinstance(d, list):
+        return [rewrite_references(v, replacements) for v in d]
+    elif isinstance(d, str) and d.startswith('$ref/'):
+        step_id, name = d[5:].split('/', 1)
+        replacement = replacements.get(step_id)
+        if replacement is None:
+            return d
+        if isinstance(replacement, dict):
+            return replacement[name]
+        return '$ref/{}/{}'.format(replacement, name)
+    return d
+
+
+def rename_steps(plans):
+    """ Step ids restart from 000001 for each plan generated by make_plan, prefix the ids of
+    plans that collide with a previous one """
+    seen = set()
+    renamed = []
+    for i, plan in enumerate(plans):
+        ids = set(step['id'] for step in plan)
+        if ids & seen:
+            replacements = {step_id: '{}-{}'.format(i + 1, step_id) for step_id in ids}
+            plan = [dict(rewrite_references(step, replacements), id=replacements[step['id']]) for step in plan]
+            ids = set(replacements.values())
+        seen |= ids
+        renamed.append(plan)
+    return renamed
+
+
+def optimize(plans, known=None):
+    """ Merges plans into one, dropping the lookups that are known or duplicated """
+    known = known or {}
+    replacements = {}   # dropped step id -> id of the step kept in its place, or dict of its outputs
+    lookups = {}        # lookup key -> id of the step kept for it
+    steps = []
+    for plan in rename_steps(plans):
+        for step in plan:
+            step = rewrite_references(step, replacements)
+            if step['action'] in FIND_ACTIONS:
+                key = lookup_key(step['action'], step.get('params', {}), step.get('query', {}))
+                if key in known:
+                    replacements[step['id']] = {o['name']: known[key] for o in step.get('outputs', [])}
+                    continue
+                if key in lookups:
+                    replacements[step['id']] = lookups[key]
+                    continue
+                lookups[key] = step['id']
+            steps.append(step)
+    return steps
+
+
+def main(args):
+    known = {}
+    for setup_fname in args.setup or []:
+        known.update(known_ids(load_plan(setup_fname), load_status(setup_fname)))
+    print('Loaded {} ids from setup plans.'.format(len(known)))
+    plans = [load_plan(fname) for fname in args.plans]
+    total_steps = sum(len(plan) for plan in plans)
+    plan = optimize(plans, known)
+    print('Optimized plan has {} steps ({} removed).'.format(len(plan), total_steps - len(plan)))
+    write_plan(plan, args.output)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('plans', nargs='+', help='Plans to optimize. Several plans are merged into one')
+    parser.add_argument('--setup', '-S', action='append',
+                        help='Setup plan that was executed, the ids in its .status file replace lookups. Can be repeated')
+    parser.add_argument('--output', '-o', help='File to write the optimized plan to (MUST NOT exist)', required=True)
+    main(parser.parse_args())
@@ -10,6 +10,28 @@ CSV format for EC2 imports:
 server id, farm name, farm role alias, region, instance type, VPC id, subnet, role id, security groups (space separated), project id
 """
 
+ALIAS_RE = re.compile(r'^[a-zA-Z\d][a-zA-Z\d\-]*[a-zA-Z\d]$')
+AWS_ID = r'[0-9a-f]{8}(?:[0-9a-f]{9})?'
+
+# Validation rules for the columns of the source CSV: (index, column name, pattern)
+COLUMNS = [
+    (0, 'server id', re.compile(r'^i-' + AWS_ID + '$')),
+    (1, 'farm name', re.compile(r'\S')),
+    (2, 'farm role alias', ALIAS_RE),
+    # Only reject what certainly is not a region or an instance type: any number of hyphenated
+    # parts (us-gov-west-1, us-isob-east-1), sizes with hyphens (c7i.metal-24xl)
+    (3, 'region', re.compile(r'^[a-z]{2}(?:-[a-z]+)+-\d+$')),
+    (4, 'instance type', re.compile(r'^[a-z][a-z0-9-]*\.[a-z0-9-]+$')),
+    (5, 'VPC id', re.compile(r'^vpc-' + AWS_ID + '$')),
+    (6, 'subnet', re.compile(r'^subnet-' + AWS_ID + '$')),
+    (7, 'role id', re.compile(r'^\d+$')),
+    (8, 'security groups', re.compile(r'^\s*sg-' + AWS_ID + r'(?:\s+sg-' + AWS_ID + r')*\s*$')),
+    (9, 'project', re.compile(r'\S')),
+]
+
+# Columns that must have the same value on all the lines of a farm role (subnets can differ)
+FARM_ROLE_COLUMNS = (3, 4, 5, 7, 8)
+
 
 def farm_role_from_line(line):
     return {
@@ -25,7 +47,7 @@ def farm_role_from_line(line):
 
 def check_farm_role(structure):
     # Check alias
-    if not re.match('^[a-zA-Z\d][a-zA-Z\d\-]*[a-zA-Z\d]$', structure['alias']):
+    if not ALIAS_RE.match(structure['alias']):
         print('ERROR: invalid farm role alias: {}. Must contain only letters, numbers and dashes'.format(structure['alias']))
         raise ValueError
     # Check SG list is not empty
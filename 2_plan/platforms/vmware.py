@@ -11,6 +11,29 @@ vm-1372,Farm Name,Farm role alias,datacenter-21,0f52797dd8ba,network-30,96554,do
 VMID                              Location      Inst. typeID network ID Role  Cpt res                               Folder
 """
 
+ALIAS_RE = re.compile(r'^[a-zA-Z\d][a-zA-Z\d\-]*[a-zA-Z\d]$')
+
+# Validation rules for the columns of the source CSV: (index, column name, pattern)
+COLUMNS = [
+    (0, 'VM id', re.compile(r'^vm-\d+$')),
+    (1, 'farm name', re.compile(r'\S')),
+    (2, 'farm role alias', ALIAS_RE),
+    (3, 'datacenter', re.compile(r'^datacenter-\d+$')),
+    (4, 'instance type', re.compile(r'^\S+$')),
+    (5, 'network id', re.compile(r'^(?:network|dvportgroup)-\d+$')),
+    (6, 'role id', re.compile(r'^\d+$')),
+    (7, 'compute resource id', re.compile(r'^domain-[cs]\d+$')),
+    (8, 'host id', re.compile(r'^host-\d+$')),
+    (9, 'project', re.compile(r'\S')),
+    (10, 'folder id', re.compile(r'^group-v\d+$')),
+    (11, 'resource group id', re.compile(r'^resgroup-(?:v)?\d+$')),
+    (12, 'datastore id', re.compile(r'^datastore-\d+$')),
+]
+
+# Columns that must have the same value on all the lines of a farm role
+FARM_ROLE_COLUMNS = (3, 4, 5, 6, 7, 8, 10, 11, 12)
+
+
 def farm_role_from_line(line):
     return {
         'alias': line[2],
@@ -28,7 +51,7 @@ def farm_role_from_line(line):
 
 def check_farm_role(structure):
     # Check alias
-    if not re.match('^[a-zA-Z\d][a-zA-Z\d\-]*[a-zA-Z\d]$', structure['alias']):
+    if not ALIAS_RE.match(structure['alias']):
         print('ERROR: invalid farm role alias: {}. Must contain only letters, numbers and dashes'.format(structure['alias']))
         raise ValueError
 
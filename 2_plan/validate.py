@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+"""
+Validation of the source CSV files
+
+All the lines are checked in a single pass against the column rules of the platform
+(platform.COLUMNS) and for consistency between the lines that define the same farm or
+farm role, and all the errors found are reported at once.
+"""
+
+
+def validate(platform, data):
+    """ Returns the list of (line number, error message) for all the problems found in data """
+    errors = []
+    n_columns = len(platform.COLUMNS)
+    servers = {}        # server id -> line number
+    farms = {}          # farm name -> (line number, project)
+    farm_roles = {}     # (farm name, alias) -> (line number, values of the farm role columns)
+    for line_number, line in enumerate(data, 1):
+        if len(line) != n_columns:
+            errors.append((line_number, 'expected {} columns, found {}'.format(n_columns, len(line))))
+            continue
+        for index, name, pattern in platform.COLUMNS:
+            if not pattern.match(line[index]):
+                errors.append((line_number, 'invalid {}: "{}"'.format(name, line[index])))
+
+        server_id, farm_name, alias, project = line[0], line[1], line[2], line[9]
+        if server_id in servers:
+            errors.append((line_number, 'server {} already listed at line {}'.format(server_id, servers[server_id])))
+        else:
+            servers[server_id] = line_number
+
+        if farm_name not in farms:
+            farms[farm_name] = (line_number, project)
+        elif farms[farm_name][1] != project:
+            errors.append((line_number, 'project for farm {} defined as {}, previously defined as {} at line {}'.format(
+                farm_name, project, farms[farm_name][1], farms[farm_name][0])))
+
+        values = tuple(line[index] for index in platform.FARM_ROLE_COLUMNS)
+        if (farm_name, alias) not in farm_roles:
+            farm_roles[(farm_name, alias)] = (line_number, values)
+        elif farm_roles[(farm_name, alias)][1] != values:
+            first_line, first_values = farm_roles[(farm_name, alias)]
+            columns = dict((index, name) for index, name, _ in platform.COLUMNS)
+            for index, value, first_value in zip(platform.FARM_ROLE_COLUMNS, values, first_values):
+                if value != first_value:
+                    errors.append((line_number, '{} for farm role {} in farm {} defined as {}, previously defined as {} at line {}'.format(
+                        columns[index], alias, farm_name, value, first_value, first_line)))
+    return errors
@@ -2,23 +2,44 @@
 # -*- coding: utf-8 -*-
 
 import argparse
-import base64
-import collections
-import datetime
+import collections.abc
+import concurrent.futures
 import hashlib
-import hmac
-import json
+import heapq
 import logging
 import os
-import pytz
-import requests
+import threading
+import time
 import urllib
-import yaml
 
+# requests, through scalr_api, is imported where it is used, and the serialization layer only
+# imports yaml on first use, so that resuming from a plan cache (and --help) does not pay for
+# loading them
+import log_pipeline
+import plan_graph
+import scheduler
+import simulate
+import verify
+import common_path  # noqa: F401 (makes ../common importable)
+from common import serialization
+from snapshot import InventorySnapshot
 
-logging.basicConfig(level=logging.INFO)
 
 dry_run = False
+snapshot = None     # InventorySnapshot used to resolve lookups offline on dry runs
+step_deadline = None    # Seconds each step may spend on its requests, pagination and lookup fallbacks included
+
+# Seconds before the first retry of a failed step (--retry-delay), doubled at each attempt up to
+# MAX_RETRY_DELAY, so that transient failures (overloaded server, timeouts) have time to clear
+RETRY_DELAY = 2
+MAX_RETRY_DELAY = 60
+
+class StepFailure(Exception):
+    """ A step did not complete, the message says why """
+
+
+# Serializes the updates of the outputs of the plans (and their status files) between workers
+outputs_lock = threading.Lock()
 
 
 actions = {
@@ -92,109 +113,15 @@ def query_yes_no(question, default='yes'):
             print('Please respond with "yes" or "no" (or "y" or "n").')
 
 
-class ScalrApiClient(object):
-    def __init__(self, api_url, key_id, key_secret):
-        self.api_url = api_url
-        self.key_id = key_id
-        self.key_secret = key_secret
-        self.logger = logging.getLogger("api[{0}]".format(self.api_url))
-        self.session = ScalrApiSession(self)
-
-    def list(self, path, **kwargs):
-        data = []
-        while path is not None:
-            body = self.session.get(path, **kwargs).json()
-            data.extend(body["data"])
-            path = body["pagination"]["next"]
-        return data
-
-    def create(self, *args, **kwargs):
-        return self.session.post(*args, **kwargs).json().get("data")
-
-    def fetch(self, *args, **kwargs):
-        return self.session.get(*args, **kwargs).json()["data"]
-
-    def delete(self, *args, **kwargs):
-        self.session.delete(*args, **kwargs)
-
-    def post(self, *args, **kwargs):
-        return self.session.post(*args, **kwargs).json()["data"]
-
-
-class ScalrApiSession(requests.Session):
-    def __init__(self, client):
-        self.client = client
-        super(ScalrApiSession, self).__init__()
-
-    def prepare_request(self, request):
-        if not request.url.startswith(self.client.api_url):
-            request.url = "".join([self.client.api_url, request.url])
-        request = super(ScalrApiSession, self).prepare_request(request)
-
-        now = datetime.datetime.now(tz=pytz.timezone(os.environ.get("TZ", "UTC")))
-        date_header = now.isoformat()
-
-        url = urllib.parse.urlparse(request.url)
-
-        # TODO - Spec isn't clear on whether the sorting should happen prior or after encoding
-        if url.query:
-            pairs = urllib.parse.parse_qsl(url.query, keep_blank_values=True, strict_parsing=True)
-            pairs = [list(map(urllib.parse.quote, pair)) for pair in pairs]
-            pairs.sort(key=lambda pair: pair[0])
-            canon_qs = "&".join("=".join(pair) for pair in pairs)
-        else:
-            canon_qs = ""
-
-        # Authorize
-        sts = b"\n".join([
-            request.method.encode('utf-8'),
-            date_header.encode('utf-8'),
-            url.path.encode('utf-8'),
-            canon_qs.encode('utf-8'),
-            request.body if request.body is not None else b""
-        ])
-
-        sig = " ".join([
-            "V1-HMAC-SHA256",
-            base64.b64encode(hmac.new(self.client.key_secret.encode('utf-8'), sts, hashlib.sha256).digest()).decode('utf-8')
-        ])
-
-        request.headers.update({
-            "X-Scalr-Key-Id": self.client.key_id,
-            "X-Scalr-Signature": sig,
-            "X-Scalr-Date": date_header
-        })
-
-        self.client.logger.debug("URL: %s", request.url)
-        self.client.logger.debug("StringToSign: %s", repr(sts))
-        self.client.logger.debug("Signature: %s", repr(sig))
-
-        return request
-
-    def request(self, *args, **kwargs):
-        res = super(ScalrApiSession, self).request(*args, **kwargs)
-        self.client.logger.info("%s - %s", " ".join(args), res.status_code)
-        # try:
-        #     errors = res.json().get("errors", None)
-        #     if errors is not None:
-        #         for error in errors:
-        #             self.client.logger.warning("API Error (%s): %s", error["code"], error["message"])
-        # except ValueError:
-        #     self.client.logger.error("Received non-JSON response from API!")
-        # res.raise_for_status()
-        self.client.logger.debug("Received response: %s", res.text)
-        return res
-
-
 # Resolves references to the outputs of previous steps
 # Works on dicts of (dicts of () or strings) or strings only
 def resolve_references(d, outputs):
-    if isinstance(d, collections.MutableMapping):
+    if isinstance(d, collections.abc.MutableMapping):
         # Dict
         for k, v in d.items():
             d[k] = resolve_references(v, outputs)
         return d
-    elif isinstance(d, collections.MutableSequence):
+    elif isinstance(d, collections.abc.MutableSequence):
         # List
         for i, v in enumerate(d):
             d[i] = resolve_references(v, outputs)
@@ -228,7 +155,16 @@ def save_outputs(step, data, outputs):
             outputs[step['id']][o['name']] = value
 
 
-def process_step(step, client, outputs, outputs_file_name):
+def process_step(step, client, outputs, journal):
+    """ Processes a step, its requests failing once the step deadline (if any) has passed. The
+    outputs of the step are recorded in journal (a StatusJournal), unless it is None. Raises
+    StepFailure, or the error of the API call, if the step does not complete """
+    with client.deadline(step_deadline):
+        return run_step(step, client, outputs, journal)
+
+
+def run_step(step, client, outputs, journal):
+    started = time.time()
     action = actions[step['action']]
     params = resolve_references(step.get('params', {}), outputs)
     url = action['url'].format(**params)
@@ -238,19 +174,32 @@ def process_step(step, client, outputs, outputs_file_name):
     if dry_run and action['skip-on-dry-run']:
         logging.info('Dry run: skipping action %s (%s)', step['id'], step['action'])
         logging.info('Would have queried: %s body: %s', full_url, body)
+        if snapshot is not None and step['action'] == 'import-server' \
+                and snapshot.find_server(body['cloudServerId']) is not None:
+            logging.info('Server %s is already managed by Scalr', body['cloudServerId'])
+        # Later steps reference the objects this one would have created: give them placeholder ids
+        # (dry runs do not save their outputs)
+        object_id = 'dry-run-{}'.format(step['id'])
+        with outputs_lock:
+            if snapshot is not None:
+                object_id = snapshot.add(step['action'], params, body, object_id)
+            save_outputs(step, {o['location']: object_id for o in step.get('outputs', [])}, outputs)
         return True     # Success
 
     # try:
     if action['method'] == 'list':
-        data = client.list(full_url)
+        if dry_run and snapshot is not None:
+            data = snapshot.lookup(step['action'], params, query)
+        else:
+            data = client.list(full_url)
         if len(data) != 1:
-            logging.error('List operation in step %s returned %d results (expected 1)', step['id'], len(data))
-            return False
+            raise StepFailure('List operation returned {} results (expected 1): {}'.format(len(data), full_url))
         data = data[0]
     elif action['method'] == 'post':
         try:
             data = client.post(full_url, json=body)
-        except:
+        except Exception as error:
+            # The object may exist already (e.g. created by an interrupted run), look it up
             if step['action'] == 'create-farm':
                 name = urllib.parse.quote(body['name'])
                 data1 = client.list(full_url + 'name=' + name)
@@ -260,13 +209,23 @@ def process_step(step, client, outputs, outputs_file_name):
             elif step['action'] == 'import-server':
                 server_id = body['cloudServerId']
                 data1 = client.list(full_url.replace('actions/import-server', 'servers') + 'cloudServerId=' + server_id)
-
+            else:
+                raise
+            if not data1:
+                raise StepFailure('{} failed with {!r}, and no existing object was found'.format(
+                    step['action'], error)) from error
             data = data1[0]
 
-    save_outputs(step, data, outputs)
-    outputs[step['id']]['complete'] = True
-    # Save the outputs after each successful step so that we don't lose any info (but don't do it on dry runs)
-    save_outputs_to_file(outputs, outputs_file_name)
+    with outputs_lock:
+        save_outputs(step, data, outputs)
+        outputs[step['id']]['complete'] = True
+        # Recorded for the execution time forecasts (--simulate)
+        outputs[step['id']]['duration'] = round(time.time() - started, 3)
+        step_outputs = dict(outputs[step['id']])
+    # Save the outputs after each successful step so that we don't lose any info (there is no
+    # journal on dry runs)
+    if journal is not None:
+        journal.record(step['id'], step_outputs)
     return True
 
     # except:
@@ -280,51 +239,354 @@ def process_step(step, client, outputs, outputs_file_name):
     #         raise
 
 
-def process_plan(plan, client, outputs_file_name):
-    total_steps = len(plan)
+def process_plan(plan, client, outputs_file_name, workers=1, keep_going=False, attempts=1,
+                 schedule='plan', fair=False, latency_model=None, retry_delay=RETRY_DELAY):
+    return process_plans([(plan, outputs_file_name)], client, workers, keep_going, attempts,
+                         schedule, fair, latency_model, retry_delay)
+
+
+def process_plans(plans, client, workers=1, keep_going=False, attempts=1,
+                  schedule='plan', fair=False, latency_model=None, retry_delay=RETRY_DELAY):
+    """ Executes one or several plans, each step as soon as the steps it depends on are complete
+
+    plans is a list of (plan, outputs file name) pairs, each plan keeps its own outputs and status
+    file. Steps of later plans wait for the farms (and farm roles) they look up to be created and
+    launched by earlier plans, so that e.g. the servers of a farm can be imported while other
+    farms are still being set up.
+
+    Among the steps that are ready, the order depends on schedule (see scheduler.py): by default
+    steps of later plans are processed first, then steps in plan order, so that with a single
+    worker and a single plan steps are processed in plan order. With fair, farms take turns.
+    latency_model (seconds per action type) is used by the critical-path schedule.
+
+    By default, the execution stops at the first failed step. With keep_going, a failed step is
+    retried until it has been attempted `attempts` times, then it is given up on together with the
+    steps that depend on it, and all the other steps go on. Retries wait retry_delay seconds after
+    the first failure, twice as long after each next one (up to MAX_RETRY_DELAY), and steps that
+    are ready go first.
+
+    Returns a dict of (plan index, step id) -> error for the steps that failed or were not
+    processed because they depend on a failed step.
+    """
+    steps = {}
+    positions = {}
+    runs = []
+    for i, (plan, outputs_file_name) in enumerate(plans):
+        outputs = load_outputs(outputs_file_name) or {}
+        runs.append((outputs, None if dry_run else StatusJournal(outputs_file_name, outputs)))
+        for position, step in enumerate(plan):
+            steps[(i, step['id'])] = step
+            positions[(i, step['id'])] = position
+    deps = plan_graph.plans_dependencies([plan for plan, _ in plans])
+    dependents = plan_graph.plan_dependents(deps)
+    latencies = {node: (latency_model or {}).get(step['action'], simulate.DEFAULT_LATENCY) for node, step in steps.items()}
+    ready = scheduler.ReadyQueue(scheduler.step_priorities(steps, positions, dependents, schedule, latencies),
+                                 scheduler.farm_groups(steps) if fair else None)
+    total_steps = len(steps)
     logging.info('Starting import plan. %d steps to process.', total_steps)
-    outputs = load_outputs(outputs_file_name) or {}
-    for step_number, step in enumerate(plan):
-        logging.info('Processing step %s (%d/%d)', step['id'], step_number+1, total_steps)
+
+    done = set()
+    for node, step in steps.items():
+        outputs = runs[node[0]][0]
         if step['id'] not in outputs:
             outputs[step['id']] = {}
         if outputs[step['id']].get('complete'):
             # This step already completed on a previous run, we already have its output
-            logging.info('Skipping step {}, already done'.format(step['id']))
+            logging.info('Skipping step %s, already done', step['id'])
+            done.add(node)
+    remaining = {node: len(deps[node] - done) for node in steps if node not in done}
+    for node, n in remaining.items():
+        if n == 0:
+            ready.push(node)
+
+    retries = []    # heap of (time before which not to retry, node) of the failed steps
+    tries = collections.Counter()
+    failures = {}
+    step_number = len(done)
+    failed = False
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            running = {}    # future -> node
+            while running or (not failed and (ready or retries)):
+                while not failed and len(running) < workers:
+                    if ready:
+                        node = ready.pop()
+                        step_number += 1
+                    elif retries and retries[0][0] <= time.monotonic():
+                        node = heapq.heappop(retries)[1]
+                        logging.info('Retrying step %s (attempt %d/%d)', node[1], tries[node] + 1, attempts)
+                    else:
+                        break
+                    step = steps[node]
+                    outputs, journal = runs[node[0]]
+                    logging.info('Processing step %s (%d/%d)', step['id'], step_number, total_steps)
+                    tries[node] += 1
+                    running[pool.submit(process_step, step, client, outputs, journal)] = node
+                # Wake up for the next retry, if there are retries waiting
+                timeout = max(0, retries[0][0] - time.monotonic()) if retries and not failed else None
+                if not running:
+                    time.sleep(timeout)
+                    continue
+                finished, _ = concurrent.futures.wait(running, timeout=timeout,
+                                                      return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    node = running.pop(future)
+                    if not keep_going:
+                        try:
+                            future.result()
+                        except StepFailure as e:
+                            # Let the steps already running finish, but don't start new ones
+                            logging.error('Error processing step %s: %s, aborting', node[1], e)
+                            failed = True
+                            continue
+                    else:
+                        try:
+                            future.result()
+                            error = None
+                        except StepFailure as e:
+                            error = str(e)
+                        except Exception as e:
+                            error = repr(e)
+                        if error is not None:
+                            if tries[node] < attempts:
+                                delay = min(retry_delay * 2 ** (tries[node] - 1), MAX_RETRY_DELAY)
+                                logging.warning('Error processing step %s: %s, will retry in %.1fs', node[1], error, delay)
+                                heapq.heappush(retries, (time.monotonic() + delay, node))
+                            else:
+                                logging.error('Error processing step %s: %s, giving up', node[1], error)
+                                failures[node] = error
+                                quarantine(node, dependents, remaining, failures)
+                            continue
+                    for dependent in dependents[node]:
+                        if dependent not in remaining:
+                            continue
+                        remaining[dependent] -= 1
+                        if remaining[dependent] == 0:
+                            ready.push(dependent)
+    finally:
+        # Fold the journals into the status files, also when a step raised
+        for _, journal in runs:
+            if journal is not None:
+                journal.close()
+
+    if failures:
+        failed_steps = sum(1 for node in failures if tries[node])
+        logging.error('%d steps failed, %d steps depending on them were not processed',
+                      failed_steps, len(failures) - failed_steps)
+    return failures
+
+
+def quarantine(node, dependents, remaining, failures):
+    """ Records all the steps depending (directly or not) on a failed step as failed, so that they
+    are never processed """
+    pending = list(dependents[node])
+    while pending:
+        dependent = pending.pop()
+        if dependent in failures or dependent not in remaining:
             continue
-        r = process_step(step, client, outputs, outputs_file_name)
-        if not r:
-            logging.error('Error processing step %s, aborting', step['id'])
-            break
+        failures[dependent] = 'Depends on failed step {}'.format(node[1])
+        del remaining[dependent]
+        pending.extend(dependents[dependent])
+
 
+def write_retry_plan(plan, failed_ids, outputs, fname):
+    """ Writes the failed steps of a plan to a new plan that can be executed to retry them
+
+    References to steps that completed are replaced with their outputs, so that the retry plan
+    does not depend on the status of the original plan. The error of each step is recorded in
+    its 'error' key, which is ignored on execution.
+    """
+    retry_plan = []
+    for step in plan:
+        if step['id'] not in failed_ids:
+            continue
+        step = {k: v for k, v in step.items() if k != 'error'}
+        for key in ('params', 'query', 'body'):
+            if key in step:
+                step[key] = resolve_completed_references(step[key], outputs, failed_ids)
+        step['error'] = failed_ids[step['id']]
+        retry_plan.append(step)
+    with open(fname, 'w') as retry_plan_file:
+        serialization.yaml_dump(retry_plan, retry_plan_file)
+    logging.info('Wrote %d failed steps to %s', len(retry_plan), fname)
+
+
+def resolve_completed_references(d, outputs, pending_ids):
+    """ Returns a copy of d where references to steps that are not in pending_ids are replaced
+    with their recorded outputs """
+    if isinstance(d, dict):
+        return {k: resolve_completed_references(v, outputs, pending_ids) for k, v in d.items()}
+    elif isinstance(d, list):
+        return [resolve_completed_references(v, outputs, pending_ids) for v in d]
+    elif isinstance(d, str) and d.startswith('$ref/'):
+        step_id, name = d[5:].split('/', 1)
+        if step_id not in pending_ids and name in outputs.get(step_id, {}):
+            return outputs[step_id][name]
+    return d
+
+
+class StatusJournal(object):
+    """ Records the outputs of the steps of a plan as they complete
+
+    Each step appends a JSON line to <status file>.journal, which takes the same time however large
+    the plan is, and does not hold outputs_lock: rewriting the whole status file after each step
+    made the workers wait for each other. load_outputs replays the journal over the status file,
+    and close() folds it into the status file.
+    """
+
+    def __init__(self, outputs_file_name, outputs):
+        self.outputs_file_name = outputs_file_name
+        self.outputs = outputs
+        self.lock = threading.Lock()
+        self.journal = open(outputs_file_name + '.journal', 'a')
+
+    def record(self, step_id, step_outputs):
+        line = serialization.json_dumps({step_id: step_outputs}) + '\n'
+        with self.lock:
+            self.journal.write(line)
+            self.journal.flush()
+
+    def close(self):
+        self.journal.close()
+        save_outputs_to_file(self.outputs, self.outputs_file_name)
+        os.remove(self.outputs_file_name + '.journal')
 
 
 def save_outputs_to_file(outputs, outputs_file_name):
     if not outputs:
         return
-    with open(outputs_file_name, 'w') as outputs_file:
-        yaml.dump(outputs, outputs_file, default_flow_style=False)
+    with open(outputs_file_name + '.tmp', 'w') as outputs_file:
+        serialization.yaml_dump(outputs, outputs_file)
+    os.replace(outputs_file_name + '.tmp', outputs_file_name)
 
 
 def load_outputs(outputs_file_name):
-    """ Load outputs generated by a previous run to resume execution at the same point """
+    """ Load outputs generated by a previous run to resume execution at the same point, including
+    the steps recorded in the journal of a run that was interrupted """
     try:
         with open(outputs_file_name) as outputs_file:
-            outputs = yaml.load(outputs_file)
-        return outputs
+            outputs = serialization.yaml_load(outputs_file) or {}
     except:
-        return {}
+        outputs = {}
+    try:
+        with open(outputs_file_name + '.journal', 'rb') as journal:
+            for line in journal:
+                try:
+                    outputs.update(serialization.json_loads(line))
+                except ValueError:
+                    # Last line of a run interrupted while writing it
+                    continue
+    except OSError:
+        pass
+    return outputs
+
+
+def validate_plan(plan):
+    """ Checks that step ids are unique, actions exist and references point to steps of the plan """
+    step_ids = set()
+    for step in plan:
+        if step['id'] in step_ids:
+            raise ValueError('Duplicate step id {}'.format(step['id']))
+        step_ids.add(step['id'])
+        if step['action'] not in actions:
+            raise ValueError('Unknown action {} in step {}'.format(step['action'], step['id']))
+    for step in plan:
+        refs = set()
+        for key in ('params', 'query', 'body'):
+            plan_graph.collect_references(step.get(key, {}), refs)
+        if not refs <= step_ids:
+            raise ValueError('Step {} references unknown steps: {}'.format(step['id'], ', '.join(sorted(refs - step_ids))))
+
+
+def load_plan(plan_filename):
+    """ Loads and validates a plan
+
+    The parsed plan is cached in <plan>.cache, next to the .status file, and reused as long as
+    the content of the plan file does not change, which saves parsing the YAML on every resume.
+    """
+    with open(plan_filename, 'rb') as plan_file:
+        content = plan_file.read()
+    digest = hashlib.sha256(content).hexdigest()
+    cache_file_name = plan_filename + '.cache'
+    try:
+        with open(cache_file_name, 'rb') as cache_file:
+            cache = serialization.unpack(cache_file.read())
+        if cache['sha256'] == digest:
+            logging.debug('Loaded plan %s from cache', plan_filename)
+            return cache['plan']
+    except Exception:
+        pass
+
+    plan = serialization.yaml_load(content)
+    validate_plan(plan)
+    # Values the cache format cannot represent, or represents differently (e.g. YAML dates), would
+    # change on resume
+    try:
+        cache = serialization.pack({'sha256': digest, 'plan': plan})
+        exact = serialization.unpack(cache)['plan'] == plan
+    except (TypeError, ValueError):
+        exact = False
+    if not exact:
+        logging.debug('Plan %s cannot be cached exactly, not caching it', plan_filename)
+        return plan
+    try:
+        with open(cache_file_name + '.tmp', 'wb') as cache_file:
+            cache_file.write(cache)
+        os.replace(cache_file_name + '.tmp', cache_file_name)
+    except OSError:
+        logging.warning('Could not write plan cache %s', cache_file_name)
+    return plan
 
 
 def main(args):
-    global dry_run
+    global dry_run, snapshot, step_deadline
     plan_filename = args.plan
-    with open(plan_filename) as plan_file:
-        plan = yaml.load(plan_file)
-    client = ScalrApiClient(args.url, args.key, args.secret)
+    plan = load_plan(plan_filename)
+    model = {}
+    if args.metrics:
+        model = simulate.latency_model_from_run(load_plan(args.metrics), load_outputs(args.metrics + '.status'))
+    model.update(simulate.parse_latencies(args.latency))
+    if args.simulate:
+        plans = [plan] + ([load_plan(args.import_plan)] if args.import_plan else [])
+        simulate.forecast(plans, model, args.workers, args.rate_limit)
+        return
+    from scalr_api import ScalrApiClient
+    client = ScalrApiClient(args.url, args.key, args.secret, (args.connect_timeout, args.read_timeout),
+                            args.hedge, args.workers)
+    step_deadline = args.step_deadline
     if args.dry_run:
         dry_run = True
-    process_plan(plan, client, plan_filename + '.status')
+        if args.snapshot:
+            snapshot = InventorySnapshot.load(args.snapshot)
+            logging.info('Dry run: resolving lookups from snapshot %s', args.snapshot)
+    plans = [(plan_filename, plan)]
+    if args.import_plan:
+        plans.append((args.import_plan, load_plan(args.import_plan)))
+    failures = process_plans([(p, fname + '.status') for fname, p in plans], client,
+                             args.workers, args.keep_going, args.attempts,
+                             args.schedule, args.fair, model, args.retry_delay)
+    for i, (fname, p) in enumerate(plans):
+        failed_ids = {step_id: error for (plan_index, step_id), error in failures.items() if plan_index == i}
+        if failed_ids:
+            write_retry_plan(p, failed_ids, load_outputs(fname + '.status') or {}, fname + '.failed.yml')
+    if args.verify and not dry_run:
+        for fname, p in plans:
+            if any(step['action'] == 'import-server' for step in p):
+                verify_plan(p, fname, client, args)
+
+
+def verify_plan(plan, plan_filename, client, args):
+    """ Waits for the servers imported by the plan to be running and writes the reconciliation
+    report to <plan>.verify.yml """
+    report = verify.verify_imports(plan, load_outputs(plan_filename + '.status') or {}, client,
+                                   args.expected_state, args.verify_timeout, args.workers)
+    failed = sorted(server_id for server_id, server in report.items() if not server['ok'])
+    for server_id in failed:
+        logging.error('Server %s is %s, expected %s', server_id, report[server_id]['state'] or 'unknown to Scalr',
+                      args.expected_state)
+    logging.info('Verification: %d servers %s, %d not', len(report) - len(failed), args.expected_state, len(failed))
+    with open(plan_filename + '.verify.yml', 'w') as report_file:
+        serialization.yaml_dump(report, report_file)
 
 
 if __name__ == '__main__':
@@ -335,4 +597,53 @@ if __name__ == '__main__':
     parser.add_argument('--plan', '-p', help='Import plan')
     parser.add_argument('--dry-run', '-z', action='store_true', default=False,
         help='Dry run, go through the import plan without actually importing any servers')
-    main(parser.parse_args())
+    parser.add_argument('--snapshot', '-S',
+        help='Inventory snapshot (created with snapshot.py) to resolve lookups from on dry runs, instead of the API')
+    parser.add_argument('--import-plan', '-i',
+        help='Import plan to execute together with the setup plan given with --plan: the servers of each farm '
+             'are imported as soon as the farm is set up and launched')
+    parser.add_argument('--keep-going', '-K', action='store_true', default=False,
+        help='Do not stop at the first failed step: skip the steps that depend on it and process all the others. '
+             'Failed steps are written to <plan>.failed.yml, which can be executed to retry them')
+    parser.add_argument('--attempts', '-a', type=int, default=3,
+        help='With --keep-going, number of times a step is attempted before giving up on it')
+    parser.add_argument('--retry-delay', type=float, default=RETRY_DELAY,
+        help='With --keep-going, seconds before retrying a failed step, doubled at each attempt')
+    parser.add_argument('--schedule', choices=scheduler.SCHEDULES, default='plan',
+        help='Order of the steps that are ready to run: plan order, steps with the most dependents first, or '
+             'steps on the longest path first (using the --metrics/--latency model)')
+    parser.add_argument('--fair', action='store_true', default=False,
+        help='Farms (per environment) take turns, so that small farms are not delayed by large ones')
+    parser.add_argument('--verify', '-V', action='store_true', default=False,
+        help='After the import, wait for the imported servers to reach --expected-state and write a report '
+             'to <plan>.verify.yml')
+    parser.add_argument('--expected-state', default='running', help='State the imported servers must reach')
+    parser.add_argument('--verify-timeout', type=int, default=1800,
+        help='Number of seconds to wait for the imported servers to reach the expected state')
+    parser.add_argument('--simulate', action='store_true', default=False,
+        help='Do not execute the plan, forecast how long it will take')
+    parser.add_argument('--metrics', '-m',
+        help='Plan file of a previous run, the step durations in its .status file are used for the forecast and '
+             'the critical-path schedule')
+    parser.add_argument('--latency', '-l', action='append', metavar='ACTION=SECONDS',
+        help='Latency of an action type for the forecast and the critical-path schedule, e.g. import-server=2.5. '
+             'Can be repeated')
+    parser.add_argument('--workers', '-w', type=int, default=1, help='Number of steps to run concurrently')
+    parser.add_argument('--connect-timeout', type=float, default=10, help='Seconds to wait for a connection to Scalr')
+    parser.add_argument('--read-timeout', type=float, default=60, help='Seconds to wait for data from Scalr')
+    parser.add_argument('--step-deadline', type=float,
+                        help='Seconds a step may take in total (all its requests), after which it fails')
+    parser.add_argument('--hedge', action='store_true', default=False,
+                        help='Send lookups again when they take longer than 95%% of the recent ones, and use the first response')
+    parser.add_argument('--rate-limit', '-r', type=float, help='Maximum number of API requests per second, for the forecast')
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+        help='DEBUG also logs the API requests and responses')
+    parser.add_argument('--log-format', default='text', choices=['text', 'json'],
+        help='json writes one JSON object per line')
+    parser.add_argument('--log-file', help='File to write the logs to, instead of stderr')
+    args = parser.parse_args()
+    listener = log_pipeline.setup_logging(getattr(logging, args.log_level), args.log_format == 'json', args.log_file)
+    try:
+        main(args)
+    finally:
+        listener.stop()
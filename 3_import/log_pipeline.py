@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+"""
+Non-blocking logging for the importer
+
+Log records are put on a queue by the workers and formatted and written by a background
+thread, so that slow terminals or disks, and the formatting itself, stay out of the steps.
+Records can be written as text (the logging default format) or as JSON lines.
+"""
+
+import logging
+import logging.handlers
+import queue
+
+import common_path  # noqa: F401 (makes ../common importable)
+from common import serialization
+
+
+# Arguments that cannot change between the logging call and the formatting by the listener
+IMMUTABLE_ARGS = (str, bytes, int, float, bool, type(None))
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """ Queues records as they are when their arguments are immutable scalars: unlike
+    QueueHandler, the message is then formatted by the listener, not in the logging thread.
+    Records with other arguments (dicts, lists...) are formatted right away, since the caller may
+    change them before the listener gets to them """
+
+    def prepare(self, record):
+        # A single dict argument becomes the args of the record, the dict itself can change
+        args = record.args
+        if args and (isinstance(args, dict) or not all(isinstance(arg, IMMUTABLE_ARGS) for arg in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """ Formats records as one JSON object per line """
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return serialization.json_dumps(entry, default=str)
+
+
+def setup_logging(level=logging.INFO, json_lines=False, log_file=None):
+    """ Routes all logging through a queue to a background thread writing to log_file (stderr by
+    default). Returns the listener, which must be stopped to flush the queue before exiting """
+    handler = logging.FileHandler(log_file) if log_file else logging.StreamHandler()
+    if json_lines:
+        handler.setFormatter(JsonLinesFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, handler)
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(DeferredQueueHandler(records))
+    root.setLevel(level)
+    listener.start()
+    return listener
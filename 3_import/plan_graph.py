@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+"""
+Dependency structure of import plans
+
+A step depends on every step whose outputs it references with $ref/<step id>/<output>.
+launch-farm steps also depend on all the create-farm-role steps of the same farm, since
+the farm must not be launched before its farm roles exist.
+"""
+
+
+def ref_step_id(value):
+    """ Returns the id of the step referenced by a $ref/ string, or None """
+    if isinstance(value, str) and value.startswith('$ref/'):
+        return value[5:].split('/')[0]
+    return None
+
+
+def collect_references(d, refs):
+    """ Adds the ids of all the steps referenced in d (dict, list or scalar) to refs """
+    if isinstance(d, dict):
+        for v in d.values():
+            collect_references(v, refs)
+    elif isinstance(d, list):
+        for v in d:
+            collect_references(v, refs)
+    else:
+        step_id = ref_step_id(d)
+        if step_id is not None:
+            refs.add(step_id)
+    return refs
+
+
+def plan_dependencies(plan):
+    """ Returns a dict of step id -> set of ids of the steps of the plan it depends on
+
+    References to steps that are not part of the plan (e.g. resolved from the status of
+    another plan) are not dependencies.
+    """
+    step_ids = set(step['id'] for step in plan)
+    deps = {}
+    farm_roles = {}     # id of the step that creates/finds the farm -> create-farm-role step ids
+    for step in plan:
+        refs = set()
+        for key in ('params', 'query', 'body'):
+            collect_references(step.get(key, {}), refs)
+        deps[step['id']] = refs & step_ids
+        if step['action'] == 'create-farm-role':
+            farm_step_id = ref_step_id(step['params'].get('farmId'))
+            farm_roles.setdefault(farm_step_id, []).append(step['id'])
+    for step in plan:
+        if step['action'] == 'launch-farm':
+            farm_step_id = ref_step_id(step['params'].get('farmId'))
+            deps[step['id']].update(farm_roles.get(farm_step_id, []))
+    return deps
+
+
+def plan_dependents(deps):
+    """ Inverts the result of plan_dependencies: step id -> list of ids of the steps depending on it """
+    dependents = {step_id: [] for step_id in deps}
+    for step_id, step_deps in deps.items():
+        for dep in step_deps:
+            dependents[dep].append(step_id)
+    return dependents
+
+
+def plans_dependencies(plans):
+    """ Dependencies of several plans executed together, e.g. a setup plan and an import plan
+
+    Steps are identified by (index of the plan, step id). Besides the dependencies within each
+    plan, find-farm steps depend on the steps of the previous plans that create (and launch, if
+    they do) the farm they look up, and find-farm-role steps on the step creating the farm role.
+    """
+    deps = {}
+    farms = {}          # (envId, farm name) -> last step preparing the farm
+    farm_roles = {}     # (envId, farm name, alias) -> step creating the farm role
+    for i, plan in enumerate(plans):
+        plan_deps = plan_dependencies(plan)
+        found_farms = {}    # find-farm step id -> (envId, farm name)
+        for step in plan:
+            node = (i, step['id'])
+            deps[node] = set((i, dep) for dep in plan_deps[step['id']])
+            env_id = str(step.get('params', {}).get('envId'))
+            if step['action'] == 'find-farm':
+                farm_key = (env_id, step['query']['name'])
+                found_farms[step['id']] = farm_key
+                if farm_key in farms:
+                    deps[node].add(farms[farm_key])
+            elif step['action'] == 'find-farm-role':
+                farm_key = found_farms.get(ref_step_id(step['params'].get('farmId')))
+                if farm_key is not None:
+                    role_key = farm_key + (step['query']['alias'],)
+                    if role_key in farm_roles:
+                        deps[node].add(farm_roles[role_key])
+
+        created_farms = {}  # create-farm step id -> (envId, farm name)
+        for step in plan:
+            env_id = str(step.get('params', {}).get('envId'))
+            if step['action'] == 'create-farm':
+                created_farms[step['id']] = (env_id, step['body']['name'])
+                farms[created_farms[step['id']]] = (i, step['id'])
+        for step in plan:
+            farm_key = created_farms.get(ref_step_id(step.get('params', {}).get('farmId')))
+            if farm_key is None:
+                continue
+            if step['action'] == 'create-farm-role':
+                farm_roles[farm_key + (step['body']['alias'],)] = (i, step['id'])
+            elif step['action'] == 'launch-farm':
+                farms[farm_key] = (i, step['id'])
+    return deps
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import base64
+import collections
+import concurrent.futures
+import contextlib
+import datetime
+import hashlib
+import hmac
+import logging
+import os
+import pytz
+import requests
+import threading
+import time
+import urllib
+
+import common_path  # noqa: F401 (makes ../common importable)
+from common.serialization import json_dumps, response_json
+
+
+# (connect, read) timeouts of the API requests, in seconds
+DEFAULT_TIMEOUT = (10, 60)
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """ Raised instead of sending a request once the step it belongs to ran out of time """
+
+
+class LatencyTracker(object):
+    """ Latencies of the most recent requests """
+
+    def __init__(self, size=200, min_samples=20):
+        self.samples = collections.deque(maxlen=size)
+        self.min_samples = min_samples
+        self.lock = threading.Lock()
+
+    def record(self, latency):
+        with self.lock:
+            self.samples.append(latency)
+
+    def percentile(self, p):
+        """ The p (0 to 1) percentile of the recent latencies, None until min_samples were recorded """
+        with self.lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def with_json_body(kwargs):
+    """ Encodes the json argument of a request with the serialization layer instead of requests' """
+    if kwargs.get('json') is not None:
+        kwargs = dict(kwargs)
+        kwargs['data'] = json_dumps(kwargs.pop('json')).encode('utf-8')
+        kwargs['headers'] = dict(kwargs.get('headers') or {}, **{'Content-Type': 'application/json'})
+    return kwargs
+
+
+class ScalrApiClient(object):
+    """ Client of the Scalr APIv2
+
+    Requests time out after timeout (connect, read) seconds. With hedge, the GETs of list, which
+    are idempotent, are sent a second time when they take longer than 95% of the recent GETs, and
+    the first response is used; workers is the number of threads making requests concurrently.
+    """
+
+    def __init__(self, api_url, key_id, key_secret, timeout=DEFAULT_TIMEOUT, hedge=False, workers=1):
+        self.api_url = api_url
+        self.key_id = key_id
+        self.key_secret = key_secret
+        self.timeout = timeout
+        self.logger = logging.getLogger("api[{0}]".format(self.api_url))
+        self.session = ScalrApiSession(self)
+        self.latencies = LatencyTracker()
+        self.local = threading.local()      # deadline of the step each thread is processing
+        # Runs both the original and the duplicate requests, so that the caller can wait for either.
+        # Requests that lost the race keep a thread until they complete, hence the spare threads
+        hedge_threads = 4 * workers if hedge else 0
+        self.hedge_pool = concurrent.futures.ThreadPoolExecutor(max_workers=hedge_threads) if hedge else None
+        # Keep a connection for each thread that can make requests, the default pool only keeps 10
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers + hedge_threads)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @contextlib.contextmanager
+    def deadline(self, seconds):
+        """ Limits the total time of the requests made by the current thread in the block, None for
+        no limit """
+        previous = getattr(self.local, 'deadline', None)
+        self.local.deadline = time.monotonic() + seconds if seconds else None
+        try:
+            yield
+        finally:
+            self.local.deadline = previous
+
+    def request_timeout(self):
+        """ timeout argument of the next request of the current thread: the client timeouts, capped
+        to what remains of the deadline (the read timeout applies to each read of the socket, so
+        a response trickling in can still overrun the deadline a bit) """
+        deadline = getattr(self.local, 'deadline', None)
+        if deadline is None:
+            return self.timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("Step deadline exceeded")
+        connect, read = self.timeout
+        return min(connect, remaining), min(read, remaining)
+
+    def get_hedged(self, path, **kwargs):
+        """ GET for idempotent requests, hedged if the client hedges and enough latencies were
+        recorded to know what a slow request is
+
+        The latencies recorded are the ones seen by the callers: the duplicate requests that lose
+        the race do not count, or they would push the 95th percentile up to the slow requests.
+        """
+        started = time.monotonic()
+        res = self._get_hedged(path, **kwargs)
+        self.latencies.record(time.monotonic() - started)
+        return res
+
+    def _get_hedged(self, path, **kwargs):
+        delay = self.latencies.percentile(0.95) if self.hedge_pool is not None else None
+        if delay is None:
+            return self.session.get(path, **kwargs)
+        # The deadline is only known in this thread, the timeouts are computed here
+        timeout = kwargs.pop("timeout", None)
+        first = self.hedge_pool.submit(self.session.get, path, timeout=timeout or self.request_timeout(), **kwargs)
+        done, _ = concurrent.futures.wait([first], timeout=delay)
+        if done:
+            return first.result()
+        # The duplicate only gets what remains of the deadline, and is not sent if nothing does
+        try:
+            hedge_timeout = timeout or self.request_timeout()
+        except DeadlineExceeded:
+            return first.result()
+        self.logger.debug("No response after %.3fs, hedging GET %s", delay, path)
+        pending = {first, self.hedge_pool.submit(self.session.get, path, timeout=hedge_timeout, **kwargs)}
+        while True:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+            if not pending:
+                return done.pop().result()
+
+    def list(self, path, **kwargs):
+        data = []
+        while path is not None:
+            body = response_json(self.get_hedged(path, **kwargs))
+            data.extend(body["data"])
+            path = body["pagination"]["next"]
+        return data
+
+    def create(self, *args, **kwargs):
+        return response_json(self.session.post(*args, **with_json_body(kwargs))).get("data")
+
+    def fetch(self, *args, **kwargs):
+        return response_json(self.session.get(*args, **kwargs))["data"]
+
+    def delete(self, *args, **kwargs):
+        self.session.delete(*args, **kwargs)
+
+    def post(self, *args, **kwargs):
+        return response_json(self.session.post(*args, **with_json_body(kwargs)))["data"]
+
+
+class ScalrApiSession(requests.Session):
+    def __init__(self, client):
+        self.client = client
+        super(ScalrApiSession, self).__init__()
+
+    def prepare_request(self, request):
+        if not request.url.startswith(self.client.api_url):
+            request.url = "".join([self.client.api_url, request.url])
+        request = super(ScalrApiSession, self).prepare_request(request)
+
+        now = datetime.datetime.now(tz=pytz.timezone(os.environ.get("TZ", "UTC")))
+        date_header = now.isoformat()
+
+        url = urllib.parse.urlparse(request.url)
+
+        # TODO - Spec isn't clear on whether the sorting should happen prior or after encoding
+        if url.query:
+            pairs = urllib.parse.parse_qsl(url.query, keep_blank_values=True, strict_parsing=True)
+            pairs = [list(map(urllib.parse.quote, pair)) for pair in pairs]
+            pairs.sort(key=lambda pair: pair[0])
+            canon_qs = "&".join("=".join(pair) for pair in pairs)
+        else:
+            canon_qs = ""
+
+        # Authorize
+        sts = b"\n".join([
+            request.method.encode('utf-8'),
+            date_header.encode('utf-8'),
+            url.path.encode('utf-8'),
+            canon_qs.encode('utf-8'),
+            request.body if request.body is not None else b""
+        ])
+
+        sig = " ".join([
+            "V1-HMAC-SHA256",
+            base64.b64encode(hmac.new(self.client.key_secret.encode('utf-8'), sts, hashlib.sha256).digest()).decode('utf-8')
+        ])
+
+        request.headers.update({
+            "X-Scalr-Key-Id": self.client.key_id,
+            "X-Scalr-Signature": sig,
+            "X-Scalr-Date": date_header
+        })
+
+        if self.client.logger.isEnabledFor(logging.DEBUG):
+            self.client.logger.debug("URL: %s", request.url)
+            self.client.logger.debug("StringToSign: %r", sts)
+            self.client.logger.debug("Signature: %r", sig)
+
+        return request
+
+    def request(self, *args, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.client.request_timeout()
+        res = super(ScalrApiSession, self).request(*args, **kwargs)
+        self.client.logger.info("%s - %s", " ".join(args), res.status_code)
+        # try:
+        #     errors = res.json().get("errors", None)
+        #     if errors is not None:
+        #         for error in errors:
+        #             self.client.logger.warning("API Error (%s): %s", error["code"], error["message"])
+        # except ValueError:
+        #     self.client.logger.error("Received non-JSON response from API!")
+        # res.raise_for_status()
+        # Decoding the body is expensive, only do it when it is going to be logged
+        if self.client.logger.isEnabledFor(logging.DEBUG):
+            self.client.logger.debug("Received response: %s", res.text)
+        return res
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+"""
+Order in which the executor dispatches the steps that are ready
+
+Steps are ordered by priority:
+ - plan: later plans first (imports before setup in combined runs), then plan order
+ - dependents: steps with the most steps depending on them, directly or not, first
+ - critical-path: steps with the longest chain of steps (in expected seconds) after them first
+
+With fairness on, the farms (per environment) take turns: each farm with ready steps gets one
+step dispatched, in priority order within the farm, before any farm gets a second one. A farm
+with thousands of servers then does not delay the small farms.
+"""
+
+import collections
+import heapq
+
+from plan_graph import ref_step_id
+
+
+SCHEDULES = ('plan', 'dependents', 'critical-path')
+
+
+def dependents_counts(order, dependents):
+    """ Number of steps depending on each step, directly or not (counted as if the dependencies
+    formed a tree: a step reachable through several paths is counted several times) """
+    counts = {}
+    for node in reversed(order):
+        counts[node] = sum(counts[dependent] + 1 for dependent in dependents[node])
+    return counts
+
+
+def critical_path_lengths(order, dependents, latencies):
+    """ Expected duration of the longest chain of steps starting with each step """
+    lengths = {}
+    for node in reversed(order):
+        lengths[node] = latencies[node] + max([lengths[dependent] for dependent in dependents[node]] or [0])
+    return lengths
+
+
+def farm_groups(steps):
+    """ Returns a dict of node -> (envId, farm) for steps given as an ordered dict of node -> step
+
+    Farms are identified by name for the steps that create or find them, and the steps referencing
+    a farm or farm role belong to the farm of the step they reference.
+    """
+    groups = {}
+    for node, step in steps.items():
+        params = step.get('params', {})
+        env_id = str(params.get('envId'))
+        if step['action'] == 'create-farm':
+            group = (env_id, step['body']['name'])
+        elif step['action'] == 'find-farm':
+            group = (env_id, step['query']['name'])
+        else:
+            farm = params.get('farmId', params.get('farmRoleId'))
+            referenced = ref_step_id(farm)
+            if referenced is not None:
+                group = groups.get((node[0], referenced), (env_id, None))
+            else:
+                group = (env_id, farm)
+        groups[node] = group
+    return groups
+
+
+def step_priorities(steps, positions, dependents, schedule='plan', latencies=None):
+    """ Returns a dict of node -> sort key, lower keys being dispatched first """
+    order = list(steps)
+    if schedule == 'dependents':
+        metric = dependents_counts(order, dependents)
+    elif schedule == 'critical-path':
+        metric = critical_path_lengths(order, dependents, latencies or {node: 1.0 for node in order})
+    else:
+        metric = {node: 0 for node in order}
+    return {node: (-metric[node], -node[0], positions[node]) for node in order}
+
+
+class ReadyQueue(object):
+    """ Steps that are ready to be dispatched, popped by priority, round-robin across groups if
+    groups (node -> group) are given """
+
+    def __init__(self, priorities, groups=None):
+        self.priorities = priorities
+        self.groups = groups
+        self.heaps = {}                     # group -> heap of (priority, node)
+        self.turns = collections.deque()    # groups that have ready steps, in turn order
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def push(self, node):
+        group = self.groups[node] if self.groups is not None else None
+        if group not in self.heaps:
+            self.heaps[group] = []
+            self.turns.append(group)
+        heapq.heappush(self.heaps[group], (self.priorities[node], node))
+        self.size += 1
+
+    def pop(self):
+        group = self.turns.popleft()
+        heap = self.heaps[group]
+        _, node = heapq.heappop(heap)
+        if heap:
+            self.turns.append(group)
+        else:
+            del self.heaps[group]
+        self.size -= 1
+        return node
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+"""
+Execution time forecast for import plans
+
+The latency of each step is taken from a per action type model (seconds per step), built
+from the durations recorded in the .status file of a previous run and/or given by hand.
+Steps are scheduled on a fixed number of workers as soon as their dependencies completed,
+in plan order, optionally limited to a number of requests per second. Several plans executed
+together (setup and import) are forecast as one plan, with the dependencies between them.
+"""
+
+import datetime
+import heapq
+import logging
+
+from plan_graph import plan_dependencies, plan_dependents, plans_dependencies
+
+
+DEFAULT_LATENCY = 1.0   # seconds, for actions the model knows nothing about
+
+# A concurrency level is considered saturated when its duration is within this margin of
+# the duration with unlimited workers
+SATURATION_MARGIN = 1.05
+
+
+def latency_model_from_run(plan, outputs):
+    """ Average duration of each action type, from the outputs of a previous run of plan """
+    totals = {}
+    for step in plan:
+        duration = outputs.get(step['id'], {}).get('duration')
+        if duration is None:
+            continue
+        total, count = totals.get(step['action'], (0.0, 0))
+        totals[step['action']] = (total + duration, count + 1)
+    return {action: total / count for action, (total, count) in totals.items()}
+
+
+def parse_latencies(values):
+    """ Parses action=seconds pairs given on the command line """
+    latencies = {}
+    for value in values or []:
+        action, _, seconds = value.partition('=')
+        latencies[action] = float(seconds)
+    return latencies
+
+
+def step_latencies(plan, model):
+    return {step['id']: model.get(step['action'], DEFAULT_LATENCY) for step in plan}
+
+
+def critical_path(plan, deps, latencies):
+    """ Returns the duration and the list of step ids of the longest dependency chain
+
+    Relies on the plan being in a valid execution order, which the sequential executor
+    requires anyway.
+    """
+    finish = {}
+    previous = {}
+    for step in plan:
+        step_id = step['id']
+        start = 0.0
+        for dep in deps[step_id]:
+            if finish[dep] > start:
+                start = finish[dep]
+                previous[step_id] = dep
+        finish[step_id] = start + latencies[step_id]
+    if not finish:
+        return 0.0, []
+    last = max(finish, key=finish.get)
+    path = [last]
+    while path[-1] in previous:
+        path.append(previous[path[-1]])
+    return finish[last], list(reversed(path))
+
+
+def simulate(plan, deps, dependents, latencies, workers, rate_limit=None):
+    """ Returns the simulated wall-clock time of the plan with the given concurrency and
+    rate limit (requests per second, None for no limit) """
+    order = {step['id']: i for i, step in enumerate(plan)}
+    remaining = {step_id: len(step_deps) for step_id, step_deps in deps.items()}
+    ready = [(order[step_id], step_id) for step_id, n in remaining.items() if n == 0]
+    heapq.heapify(ready)
+    running = []
+    now = 0.0
+    next_slot = 0.0
+    while ready or running:
+        while ready and len(running) < workers:
+            _, step_id = heapq.heappop(ready)
+            start = max(now, next_slot)
+            if rate_limit:
+                next_slot = start + 1.0 / rate_limit
+            heapq.heappush(running, (start + latencies[step_id], step_id))
+        now, step_id = heapq.heappop(running)
+        for dependent in dependents[step_id]:
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                heapq.heappush(ready, (order[dependent], dependent))
+    return now
+
+
+def saturation_point(plan, deps, dependents, latencies, rate_limit=None):
+    """ Returns the smallest number of workers beyond which adding workers does not reduce the
+    duration significantly, with the durations for the powers of two of workers tried (up to
+    the number of steps) """
+    most = max(len(plan), 1)
+    floor = simulate(plan, deps, dependents, latencies, most, rate_limit)
+
+    def saturated(duration):
+        return duration <= floor * SATURATION_MARGIN
+
+    durations = []
+    low, workers = 0, 1
+    while True:
+        duration = simulate(plan, deps, dependents, latencies, workers, rate_limit)
+        durations.append((workers, duration))
+        if saturated(duration):
+            break
+        low, workers = workers, min(workers * 2, most)
+    # Bisect between the last level tried that is not saturated and the first one that is
+    high = workers
+    while high - low > 1:
+        middle = (low + high) // 2
+        if saturated(simulate(plan, deps, dependents, latencies, middle, rate_limit)):
+            high = middle
+        else:
+            low = middle
+    return high, durations
+
+
+def combine_plans(plans):
+    """ Returns one plan made of the steps of plans executed together, with ids prefixed by the
+    number of their plan, and its dependencies """
+    node_deps = plans_dependencies(plans)
+    ids = {node: '{}/{}'.format(node[0] + 1, node[1]) for node in node_deps}
+    plan = [dict(step, id=ids[(i, step['id'])]) for i, p in enumerate(plans) for step in p]
+    deps = {ids[node]: set(ids[dep] for dep in node_deps[node]) for node in node_deps}
+    return plan, deps
+
+
+def format_duration(seconds):
+    return str(datetime.timedelta(seconds=round(seconds)))
+
+
+def forecast(plans, model, workers, rate_limit=None):
+    """ Prints the expected duration, critical path and saturation concurrency of plans executed
+    together (usually just one) """
+    if len(plans) == 1:
+        plan = plans[0]
+        deps = plan_dependencies(plan)
+    else:
+        plan, deps = combine_plans(plans)
+    dependents = plan_dependents(deps)
+    latencies = step_latencies(plan, model)
+    logging.info('Latency model (seconds per step): %s', model)
+
+    duration = simulate(plan, deps, dependents, latencies, workers, rate_limit)
+    path_duration, path = critical_path(plan, deps, latencies)
+    saturation, durations = saturation_point(plan, deps, dependents, latencies, rate_limit)
+    steps = {step['id']: step for step in plan}
+
+    print('Plan: {} steps, {} workers, rate limit: {}'.format(
+        len(plan), workers, '{}/s'.format(rate_limit) if rate_limit else 'none'))
+    print('Expected duration: {}'.format(format_duration(duration)))
+    print('Critical path: {} steps, {}'.format(len(path), format_duration(path_duration)))
+    for step_id in path:
+        print('    {} ({}, {:.2f}s)'.format(step_id, steps[step_id]['action'], latencies[step_id]))
+    print('Duration by number of workers:')
+    for n, d in durations:
+        print('    {:>6}: {}'.format(n, format_duration(d)))
+    print('More than {} workers will not significantly reduce the duration.'.format(saturation))
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import datetime
+import logging
+
+import common_path  # noqa: F401 (makes ../common importable)
+from common import serialization
+
+
+def index_by(items, key):
+    """ Groups a list of API objects by the value of one of their fields """
+    index = {}
+    for item in items:
+        index.setdefault(str(item[key]), []).append(item)
+    return index
+
+
+def take_snapshot(client, env_id):
+    """ Fetches the farms, farm roles, projects and servers of an environment and indexes them
+    the same way the find-* actions of the import plans look them up """
+    env_id = str(env_id)
+    farms = client.list('/api/v1beta0/user/{}/farms/'.format(env_id))
+    logging.info('Fetched %d farms', len(farms))
+    farm_roles = {}
+    for farm in farms:
+        roles = client.list('/api/v1beta0/user/{}/farms/{}/farm-roles/'.format(env_id, farm['id']))
+        farm_roles[str(farm['id'])] = index_by(roles, 'alias')
+    logging.info('Fetched farm roles for %d farms', len(farm_roles))
+    projects = client.list('/api/v1beta0/user/{}/projects/'.format(env_id))
+    logging.info('Fetched %d projects', len(projects))
+    servers = client.list('/api/v1beta0/user/{}/servers/'.format(env_id))
+    logging.info('Fetched %d servers', len(servers))
+    return {
+        'envId': env_id,
+        'created': datetime.datetime.utcnow().isoformat(),
+        'farms': index_by(farms, 'name'),
+        'farm-roles': farm_roles,
+        'projects': index_by(projects, 'name'),
+        'servers': index_by(servers, 'cloudServerId'),
+    }
+
+
+class InventorySnapshot(object):
+    """ In-memory view of a snapshot file, answers find-* lookups without calling the API """
+
+    def __init__(self, data):
+        self.data = data
+        self.env_id = data['envId']
+
+    @classmethod
+    def load(cls, fname):
+        with open(fname, 'rb') as snapshot_file:
+            return cls(serialization.json_loads(snapshot_file.read()))
+
+    def save(self, fname):
+        with open(fname, 'w') as snapshot_file:
+            snapshot_file.write(serialization.json_dumps(self.data))
+
+    def lookup(self, action, params, query):
+        """ Returns the list of objects the list call of a find-* step would have returned """
+        if str(params['envId']) != self.env_id:
+            raise ValueError('Snapshot was taken for environment {}, step targets environment {}'.format(
+                self.env_id, params['envId']))
+        if action == 'find-farm':
+            return self.data['farms'].get(query['name'], [])
+        elif action == 'find-farm-role':
+            roles = self.data['farm-roles'].get(str(params['farmId']), {})
+            return roles.get(query['alias'], [])
+        elif action == 'find-project':
+            return self.data['projects'].get(query['name'], [])
+        raise ValueError('Action {} cannot be resolved from a snapshot'.format(action))
+
+    def add(self, action, params, body, object_id):
+        """ Records the object a create-* step skipped by a dry run would have created, so that the
+        find-* lookups of the next steps (e.g. of an import plan run after the setup plan) find it.
+        Returns the id of the object the lookups resolve, which is the id of the existing object
+        if there is one already (the creation would have fallen back to it) """
+        if action == 'create-farm':
+            objects = self.data['farms'].setdefault(body['name'], [])
+            key, value = 'name', body['name']
+        elif action == 'create-farm-role':
+            roles = self.data['farm-roles'].setdefault(str(params['farmId']), {})
+            objects = roles.setdefault(body['alias'], [])
+            key, value = 'alias', body['alias']
+        else:
+            return object_id
+        if not objects:
+            objects.append({'id': object_id, key: value})
+        return objects[0]['id']
+
+    def find_server(self, cloud_server_id):
+        servers = self.data['servers'].get(cloud_server_id)
+        return servers[0] if servers else None
+
+
+def main(args):
+    # Imported here so that bulk_import does not load requests when it only needs InventorySnapshot
+    from scalr_api import ScalrApiClient
+    client = ScalrApiClient(args.url, args.key, args.secret)
+    snapshot = InventorySnapshot(take_snapshot(client, args.environment))
+    snapshot.save(args.output)
+    print('Saved snapshot of environment {} to {}'.format(args.environment, args.output))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', '-u', help='Scalr URL', required=True)
+    parser.add_argument('--key', '-k', help='API key ID', required=True)
+    parser.add_argument('--secret', '-s', help='API key secret', required=True)
+    parser.add_argument('--environment', '-e', help='ID of the environment to take a snapshot of', required=True)
+    parser.add_argument('--output', '-o', help='File to write the snapshot to', required=True)
+    main(parser.parse_args())
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+"""
+Verification of the servers imported by a plan
+
+The servers of each farm role of the plan are listed in one (paginated) call per farm role,
+instead of being fetched one by one. Farm roles are listed again, on an interval that grows
+while nothing changes and shrinks when servers make progress, until every imported server
+reached the expected state or the deadline passed. A farm role that cannot be listed (timeout,
+deleted farm role, unexpected response) stays pending and is listed again on the next round.
+"""
+
+import concurrent.futures
+import logging
+import time
+
+
+MIN_INTERVAL = 5        # seconds
+MAX_INTERVAL = 60
+
+
+def resolve_param(value, outputs):
+    if isinstance(value, str) and value.startswith('$ref/'):
+        step_id, name = value[5:].split('/')[:2]
+        return outputs.get(step_id, {}).get(name)
+    return value
+
+
+def expected_servers(plan, outputs):
+    """ Returns a dict of (envId, farmRoleId) -> set of cloud server ids imported by the plan.
+    Servers whose farm role id is not known from the outputs are left out """
+    expected = {}
+    for step in plan:
+        if step['action'] != 'import-server' or not outputs.get(step['id'], {}).get('complete'):
+            continue
+        params = step['params']
+        farm_role = (str(params['envId']), resolve_param(params['farmRoleId'], outputs))
+        if farm_role[1] is None:
+            logging.warning('Not verifying server %s: the id of its farm role (%s) is unknown',
+                            step['body']['cloudServerId'], params['farmRoleId'])
+            continue
+        expected.setdefault(farm_role, set()).add(step['body']['cloudServerId'])
+    return expected
+
+
+def list_farm_role_servers(client, farm_role):
+    """ Returns a dict of cloud server id -> server for the servers of the farm role, None if they
+    could not be listed """
+    env_id, farm_role_id = farm_role
+    try:
+        servers = client.list('/api/v1beta0/user/{}/farm-roles/{}/servers/'.format(env_id, farm_role_id))
+        return {server['cloudServerId']: server for server in servers}
+    except Exception as e:
+        logging.warning('Could not list the servers of farm role %s: %r', farm_role_id, e)
+        return None
+
+
+def verify_imports(plan, outputs, client, expected_state='running', timeout=1800, workers=1):
+    """ Polls the servers imported by the plan until they are all in expected_state, or timeout
+    seconds passed. Returns the reconciliation report: for each cloud server id, its farm role,
+    its last known state (None if Scalr does not know it) and whether it is as expected """
+    expected = expected_servers(plan, outputs)
+    total = sum(len(servers) for servers in expected.values())
+    logging.info('Verifying %d imported servers in %d farm roles', total, len(expected))
+    states = {}     # cloud server id -> state
+    pending = dict(expected)
+    deadline = time.time() + timeout
+    interval = MIN_INTERVAL
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            listed = dict(zip(pending, pool.map(lambda farm_role: list_farm_role_servers(client, farm_role), pending)))
+            progress = False
+            for farm_role, servers in listed.items():
+                if servers is None:
+                    continue
+                for cloud_server_id in expected[farm_role]:
+                    server = servers.get(cloud_server_id)
+                    state = server.get('status') if server is not None else None
+                    if states.get(cloud_server_id, '') != state:
+                        progress = True
+                    states[cloud_server_id] = state
+                if all(states[s] == expected_state for s in expected[farm_role]):
+                    del pending[farm_role]
+            remaining = sum(1 for servers in pending.values() for s in servers if states.get(s) != expected_state)
+            logging.info('%d/%d servers %s', total - remaining, total, expected_state)
+            if not pending:
+                break
+            interval = MIN_INTERVAL if progress else min(interval * 2, MAX_INTERVAL)
+            wait = min(interval, deadline - time.time())
+            if wait <= 0:
+                break
+            time.sleep(wait)
+
+    report = {}
+    for farm_role, servers in expected.items():
+        for cloud_server_id in servers:
+            report[cloud_server_id] = {
+                'envId': farm_role[0],
+                'farmRoleId': farm_role[1],
+                'state': states.get(cloud_server_id),
+                'ok': states.get(cloud_server_id) == expected_state,
+            }
+    return report
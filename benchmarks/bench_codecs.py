@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Encoding and decoding times of the serialization backends
+
+Compares, on payloads of the given size shaped like the ones the toolkit handles:
+ - API responses (a page of servers) and discovery output: json vs orjson
+ - import plans and status files: the pure Python YAML loader and dumper vs libyaml
+ - the plan cache: json and orjson vs msgpack
+
+Backends that are not installed are skipped.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import yaml
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+from common import serialization
+
+
+def best_of(repeat, f, *args):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def api_response(n):
+    return {
+        'data': [{
+            'id': 'a1b2c3d4-{:012x}'.format(i),
+            'cloudServerId': 'i-{:017x}'.format(i),
+            'status': 'running',
+            'launched': '2019-01-01T00:00:00Z',
+            'farmRole': {'id': i % 50},
+            'cloudFeatures': {'type': 'AwsInstanceCloudFeatures', 'ebsOptimized': False},
+        } for i in range(n)],
+        'pagination': {'first': None, 'last': None, 'next': None, 'prev': None},
+    }
+
+
+def import_plan(n):
+    return [{
+        'id': '{:06d}'.format(i),
+        'action': 'import-server',
+        'params': {'envId': '2', 'farmRoleId': '$ref/{:06d}/farmroleid'.format(i % 50)},
+        'body': {'cloudServerId': 'i-{:017x}'.format(i)},
+        'outputs': [{'name': 'serverid', 'location': 'id'}],
+    } for i in range(n)]
+
+
+def status(n):
+    return {'{:06d}'.format(i): {'complete': True, 'duration': 0.52, 'serverid': 'a1b2c3d4-{:012x}'.format(i)}
+            for i in range(n)}
+
+
+def codecs():
+    yield 'api response', api_response, [
+        ('json', json.dumps, json.loads),
+        ('orjson', lambda obj: serialization.orjson.dumps(obj), lambda data: serialization.orjson.loads(data)),
+    ]
+    pure = ('yaml (pure Python)',
+            lambda obj: yaml.dump(obj, default_flow_style=False, Dumper=yaml.SafeDumper),
+            lambda data: yaml.load(data, Loader=yaml.SafeLoader))
+    libyaml = ('yaml (libyaml)',
+               lambda obj: yaml.dump(obj, default_flow_style=False, Dumper=yaml.CSafeDumper),
+               lambda data: yaml.load(data, Loader=yaml.CSafeLoader))
+    yield 'import plan', import_plan, [pure, libyaml]
+    yield 'status file', status, [pure, libyaml]
+    yield 'plan cache', import_plan, [
+        ('json', json.dumps, json.loads),
+        ('orjson', lambda obj: serialization.orjson.dumps(obj), lambda data: serialization.orjson.loads(data)),
+        ('msgpack', lambda obj: serialization.msgpack.packb(obj, use_bin_type=True),
+         lambda data: serialization.msgpack.unpackb(data, raw=False)),
+    ]
+
+
+def available(name):
+    if name == 'orjson':
+        return serialization.orjson is not None
+    if name == 'msgpack':
+        return serialization.msgpack is not None
+    if name == 'yaml (libyaml)':
+        return hasattr(yaml, 'CSafeLoader')
+    return True
+
+
+def main(args):
+    print('{:14} {:20} {:>10} {:>10} {:>10}'.format('payload', 'backend', 'encode', 'decode', 'size'))
+    for payload, make, backends in codecs():
+        obj = make(args.items)
+        for name, encode, decode in backends:
+            if not available(name):
+                print('{:14} {:20} {:>10}'.format(payload, name, 'n/a'))
+                continue
+            data = encode(obj)
+            assert decode(data) == obj
+            print('{:14} {:20} {:>9.1f}ms {:>9.1f}ms {:>10}'.format(
+                payload, name, best_of(args.repeat, encode, obj) * 1e3, best_of(args.repeat, decode, data) * 1e3,
+                len(data)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', '-n', type=int, default=5000, help='Number of servers or steps in the payloads')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of measures, the best one is kept')
+    main(parser.parse_args())
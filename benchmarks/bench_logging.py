@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Logging overhead per step of bulk_import.py
+
+Runs import-server steps through process_step and the real ScalrApiClient (request signing
+included), against a transport adapter that answers locally, at each log level, with logs
+written synchronously (logging.basicConfig) or through the queue of log_pipeline. Status
+files are not written, to only measure the logging.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', '3_import'))
+
+import bulk_import
+import log_pipeline
+from scalr_api import ScalrApiClient
+
+
+class LocalAdapter(requests.adapters.BaseAdapter):
+    """ Answers every request with a server, as the import-server action does """
+
+    def __init__(self, response_size):
+        super(LocalAdapter, self).__init__()
+        self.content = json.dumps({'data': {'id': 'server-id', 'padding': 'x' * response_size}}).encode('utf-8')
+
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response._content = self.content
+        response.headers['Content-Type'] = 'application/json'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def run_steps(n_steps, response_size):
+    client = ScalrApiClient('http://scalr.local', 'key-id', 'key-secret')
+    client.session.mount('http://', LocalAdapter(response_size))
+    outputs = {}
+    start = time.perf_counter()
+    for i in range(n_steps):
+        step = {
+            'id': str(i),
+            'action': 'import-server',
+            'params': {'envId': '2', 'farmRoleId': 42},
+            'body': {'cloudServerId': 'i-{:017x}'.format(i)},
+            'outputs': [{'name': 'serverid', 'location': 'id'}],
+        }
+        outputs[step['id']] = {}
+        bulk_import.process_step(step, client, outputs, None)
+    return (time.perf_counter() - start) / n_steps
+
+
+def configure(mode, level, log_file):
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    if mode == 'sync':
+        handler = logging.FileHandler(log_file)
+        handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+        root.addHandler(handler)
+        root.setLevel(level)
+        return None
+    return log_pipeline.setup_logging(level, mode == 'json', log_file)
+
+
+def main(args):
+    logging.getLogger().setLevel(logging.WARNING)
+    run_steps(200, args.response_size)     # warm up
+    print('{:8} {:8} {:>14}'.format('level', 'mode', 'us per step'))
+    with tempfile.TemporaryDirectory() as tmp:
+        for level in ('WARNING', 'INFO', 'DEBUG'):
+            for mode in ('sync', 'queue', 'json'):
+                log_file = os.path.join(tmp, '{}-{}.log'.format(level, mode))
+                listener = configure(mode, getattr(logging, level), log_file)
+                per_step = run_steps(args.steps, args.response_size)
+                if listener is not None:
+                    listener.stop()
+                print('{:8} {:8} {:>14.1f}'.format(level, mode, per_step * 1e6))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--steps', '-n', type=int, default=5000, help='Number of steps for each measure')
+    parser.add_argument('--response-size', type=int, default=20000, help='Size of the API responses in bytes')
+    main(parser.parse_args())
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Scaling benchmark of the plan creation
+
+Measures the runtime and peak memory of make_farms_and_roles_plan, make_simple_plan and
+write_plan on synthetic source files from generate_source.py. The memory is measured with
+tracemalloc in a second run, since it slows the code down, and only up to --memory-rows rows
+(100000 by default, 0 to skip it). Results can be saved, and compared to saved results to catch
+regressions:
+
+    python3 bench_make_plan.py --save baseline.json
+    python3 bench_make_plan.py --baseline baseline.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', '2_plan'))
+
+import make_plan
+from generate_source import generate_rows
+from platforms import ec2
+from platforms import vmware
+
+
+def measure(f, args, memory):
+    """ Returns the runtime of f(*args), its peak memory usage (None unless memory is set, it
+    takes a second run) and its result """
+    start = time.perf_counter()
+    result = f(*args)
+    runtime = time.perf_counter() - start
+    if not memory:
+        return runtime, None, result
+    tracemalloc.start()
+    result = f(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return runtime, peak, result
+
+
+def bench_size(platform_name, rows, memory):
+    platform = ec2 if platform_name == 'ec2' else vmware
+    data, _ = generate_rows(platform_name, farms=max(1, rows // 1000), roles_per_farm=5, servers=rows,
+                            projects=10, seed=rows)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        counter = 0
+
+        def write(plan):
+            nonlocal counter
+            counter += 1
+            make_plan.write_plan(plan, os.path.join(tmp, 'plan{}.yml'.format(counter)))
+
+        for name, f, args in [
+                ('make_farms_and_roles_plan', make_plan.make_farms_and_roles_plan, (platform, data, '2')),
+                ('make_simple_plan', make_plan.make_simple_plan, (platform, data, '2'))]:
+            make_plan.make_step_id.counter = 0
+            runtime, peak, plan = measure(f, args, memory)
+            results[name] = {'seconds': runtime, 'peak_bytes': peak}
+            runtime, peak, _ = measure(write, (plan,), memory)
+            results['write_plan ({})'.format(name)] = {'seconds': runtime, 'peak_bytes': peak}
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """ Prints the measures that are worse than the baseline by more than tolerance, returns
+    the number of regressions """
+    regressions = 0
+    for rows, functions in results.items():
+        for name, measures in functions.items():
+            reference = baseline.get(rows, {}).get(name)
+            if reference is None:
+                continue
+            for key, value in measures.items():
+                # Memory is not measured at all the sizes
+                if value is None or reference.get(key) is None:
+                    continue
+                if value > reference[key] * (1 + tolerance):
+                    print('REGRESSION {} rows, {}: {} {:.3g} (baseline {:.3g})'.format(
+                        rows, name, key, value, reference[key]))
+                    regressions += 1
+    return regressions
+
+
+def main(args):
+    results = {}
+    print('{:>8}  {:40} {:>10} {:>12}'.format('rows', 'function', 'seconds', 'peak MiB'))
+    for rows in args.sizes:
+        results[str(rows)] = bench_size(args.platform, rows, rows <= args.memory_rows)
+        for name, measures in results[str(rows)].items():
+            peak = measures['peak_bytes']
+            print('{:>8}  {:40} {:>10.3f} {:>12}'.format(
+                rows, name, measures['seconds'], '-' if peak is None else '{:.1f}'.format(peak / 2 ** 20)))
+    if args.save:
+        with open(args.save, 'w') as save_file:
+            json.dump(results, save_file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+        print('No regressions compared to {}.'.format(args.baseline))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--platform', '-P', choices=['ec2', 'vmware'], default='ec2')
+    parser.add_argument('--sizes', '-n', type=int, nargs='+', default=[1000, 10000, 100000, 1000000],
+                        help='Numbers of rows of the source files')
+    parser.add_argument('--memory-rows', type=int, default=100000,
+                        help='Largest number of rows the peak memory is measured for (each function runs twice)')
+    parser.add_argument('--save', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Compare the results to a JSON file written with --save')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Relative slowdown or memory increase over the baseline reported as a regression')
+    main(parser.parse_args())
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Startup time of bulk_import.py
+
+Compares, for a synthetic import plan of the given size:
+ - importing the modules bulk_import.py used to load eagerly vs importing bulk_import.py
+ - parsing the plan with the pure Python YAML loader (as before), with the libyaml loader,
+   and loading it from the plan cache (what a resume does)
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', '3_import'))
+sys.path.insert(0, os.path.join(HERE, '..', '2_plan'))
+
+
+def timed(f, *args):
+    start = time.perf_counter()
+    result = f(*args)
+    return time.perf_counter() - start, result
+
+
+def import_time(statement):
+    """ Best of 3 runs of importing modules in a fresh interpreter """
+    times = []
+    for _ in range(3):
+        start = time.perf_counter()
+        subprocess.check_call([sys.executable, '-c', statement], cwd=os.path.join(HERE, '..', '3_import'))
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def make_import_plan(n_servers):
+    import make_plan
+    from platforms import ec2
+    data = [['i-{:017x}'.format(i), 'Farm {}'.format(i // 1000), 'role-{}'.format(i % 10)] for i in range(n_servers)]
+    return make_plan.make_simple_plan(ec2, data, '2')
+
+
+def main(args):
+    import yaml
+    import bulk_import
+
+    print('Interpreter startup + imports:')
+    print('  python -c pass:                     {:.3f}s'.format(import_time('pass')))
+    print('  import pytz, requests, yaml:        {:.3f}s'.format(import_time('import pytz, requests, yaml')))
+    print('  import bulk_import:                 {:.3f}s'.format(import_time('import bulk_import')))
+
+    plan = make_import_plan(args.servers)
+    with tempfile.TemporaryDirectory() as tmp:
+        plan_filename = os.path.join(tmp, 'plan.import.yml')
+        with open(plan_filename, 'w') as plan_file:
+            yaml.dump(plan, plan_file, default_flow_style=False)
+
+        def load_pure_python():
+            with open(plan_filename) as plan_file:
+                return yaml.load(plan_file, Loader=yaml.SafeLoader)
+
+        print('Loading a plan of {} steps:'.format(len(plan)))
+        t, _ = timed(load_pure_python)
+        print('  yaml.SafeLoader:                    {:.3f}s'.format(t))
+        t, _ = timed(bulk_import.load_plan, plan_filename)
+        print('  load_plan, no cache (writes it):    {:.3f}s'.format(t))
+        t, cached = timed(bulk_import.load_plan, plan_filename)
+        print('  load_plan, from cache:              {:.3f}s'.format(t))
+        assert cached == plan
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--servers', '-n', type=int, default=10000, help='Number of servers in the import plan')
+    main(parser.parse_args())
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+"""
+Serialization used by the discovery, planning and import stages
+
+Each format uses the fastest backend available, and falls back to the standard library
+(or the pure Python YAML implementation):
+ - JSON: orjson, else json
+ - YAML: the libyaml C loader and dumper, else the pure Python ones
+ - caches: msgpack, else JSON (never pickle: a cache file that is tampered with must not be
+   able to run code)
+
+yaml, which is slow to import, is only imported on first use.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def json_loads(data):
+    """ Decodes JSON from str or bytes """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps(obj, indent=False, default=None):
+    """ Encodes obj to a JSON str, indented by 2 spaces if indent. default is called for the objects
+    that cannot be serialized natively """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, default=default, option=option).decode('utf-8')
+    return json.dumps(obj, indent=2 if indent else None, default=default)
+
+
+def response_json(response):
+    """ Decodes the JSON body of a requests response, only once however many times it is called """
+    try:
+        return response._decoded_json
+    except AttributeError:
+        response._decoded_json = json_loads(response.content)
+        return response._decoded_json
+
+
+def _yaml():
+    import yaml
+    return yaml
+
+
+def yaml_load(stream):
+    """ Loads YAML from a str, bytes or file (safe loader) """
+    yaml = _yaml()
+    return yaml.load(stream, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+
+
+def yaml_dump(obj, stream=None):
+    """ Dumps obj as block style YAML to stream, or returns it if stream is None (safe dumper) """
+    yaml = _yaml()
+    return yaml.dump(obj, stream, default_flow_style=False, Dumper=getattr(yaml, 'CSafeDumper', yaml.SafeDumper))
+
+
+# Caches start with a marker of the backend they were written with, so that a cache written with
+# msgpack is still read (or safely rejected) in an environment without it
+_MSGPACK = b'M'
+_JSON = b'J'
+
+
+def pack(obj):
+    """ Encodes obj (made of the types JSON supports) for a cache """
+    if msgpack is not None:
+        return _MSGPACK + msgpack.packb(obj, use_bin_type=True)
+    return _JSON + json_dumps(obj).encode('utf-8')
+
+
+def unpack(data):
+    """ Decodes data written by pack, raises ValueError if it cannot be decoded here """
+    marker, payload = data[:1], data[1:]
+    if marker == _MSGPACK and msgpack is not None:
+        return msgpack.unpackb(payload, raw=False)
+    if marker == _JSON:
+        return json_loads(payload)
+    raise ValueError('Unsupported cache format')